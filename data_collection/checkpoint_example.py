@@ -10,12 +10,14 @@
 import os
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from typing import Dict, List, Set, Any, Optional
 from datetime import datetime
 from pathlib import Path
 
-# 导入断点管理器
-from checkpoint_manager import CheckpointManager
+# 导入断点管理器和城市列表
+from checkpoint_manager import CheckpointManager, load_city_list
 
 # 配置日志
 logging.basicConfig(
@@ -29,22 +31,6 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def load_city_list() -> Dict[str, Dict[str, Dict[str, float]]]:
-    """
-    从city_list.json加载城市列表
-    
-    返回:
-        Dict: 城市列表字典
-    """
-    try:
-        city_list_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'city_list.json')
-        with open(city_list_path, 'r', encoding='utf-8') as f:
-            return json.load(f)['city']
-    except Exception as e:
-        logger.error(f"加载城市列表时出错: {str(e)}")
-        return {}
-
-
 def simulate_data_collection(data_source: str, province: str, city: str, year: int) -> bool:
     """
     模拟数据收集过程
@@ -80,6 +66,9 @@ def main():
     # 数据源
     DATA_SOURCES = ["openweather", "visualcrossing"]
     
+    # 并发采集的线程数，实际采集时主要耗时在网络请求上
+    MAX_WORKERS = 32
+    
     # 加载城市列表
     city_data = load_city_list()
     if not city_data:
@@ -92,46 +81,51 @@ def main():
         logger.error(f"错误: 城市列表中没有{demo_province}")
         return
     
-    # 创建断点管理器
-    for data_source in DATA_SOURCES:
-        logger.info(f"\n===== 开始处理数据源: {data_source} =====\n")
-        checkpoint_manager = CheckpointManager(data_source)
+    # 为每个数据源创建断点管理器，退出 with 语句块时统一保存
+    with ExitStack() as stack:
+        checkpoint_managers = {
+            data_source: stack.enter_context(CheckpointManager(data_source))
+            for data_source in DATA_SOURCES
+        }
         
-        # 更新总任务数
+        # 更新总任务数，并把所有数据源未完成的城市-年份对展开成一个任务列表
         total_tasks = len(city_data[demo_province]) * len(TARGET_YEARS)
-        checkpoint_manager.update_stats(total_tasks, demo_province)
+        tasks = []
+        for data_source, checkpoint_manager in checkpoint_managers.items():
+            checkpoint_manager.update_stats(total_tasks, demo_province)
+            pending_tasks = checkpoint_manager.pending_tasks(city_data[demo_province], TARGET_YEARS)
+            logger.info(f"跳过已完成的任务 {total_tasks - len(pending_tasks)} 个 (数据源: {data_source})")
+            tasks.extend((data_source, demo_province, city, year) for city, year in pending_tasks)
         
-        # 处理每个城市和年份
-        for city, coords in city_data[demo_province].items():
-            for year in TARGET_YEARS:
-                # 检查是否已完成
-                if checkpoint_manager.is_completed(city, year, demo_province):
-                    logger.info(f"跳过已完成的任务: {demo_province} - {city} {year}年 (数据源: {data_source})")
-                    continue
-                
-                # 模拟数据收集
-                success = simulate_data_collection(data_source, demo_province, city, year)
-                
-                # 更新断点
+        # 并发执行所有任务，结果按提交顺序返回，在主线程中更新断点；
+        # 已完成的任务按数据源攒齐后批量标记，每个数据源只复制一次已完成位图
+        completed = {data_source: [] for data_source in checkpoint_managers}
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            results = executor.map(lambda task: simulate_data_collection(*task), tasks)
+            for success, (data_source, province, city, year) in zip(results, tasks):
                 if success:
-                    checkpoint_manager.mark_completed(city, year, demo_province)
+                    completed[data_source].append((city, year, None))
                 else:
-                    checkpoint_manager.mark_failed(city, year, "模拟失败", demo_province)
-        
-        # 获取统计信息
-        stats = checkpoint_manager.get_stats(demo_province)
-        logger.info(f"\n===== 数据源 {data_source} 处理统计 =====")
-        logger.info(f"总任务数: {stats['total_tasks']}")
-        logger.info(f"已完成任务数: {stats['completed_tasks']}")
-        logger.info(f"失败任务数: {stats['failed_tasks']}")
-        
-        # 获取已完成的任务
-        completed_tasks = checkpoint_manager.get_completed_tasks(demo_province)
-        logger.info(f"已完成的城市数: {len(completed_tasks)}")
+                    checkpoint_managers[data_source].mark_failed(city, year, "模拟失败")
+        for data_source, completed_tasks in completed.items():
+            if completed_tasks:
+                checkpoint_managers[data_source].mark_completed_batch(completed_tasks)
         
-        # 获取失败的任务
-        failed_tasks = checkpoint_manager.get_failed_tasks(demo_province)
-        logger.info(f"失败的城市数: {len(failed_tasks)}")
+        for data_source, checkpoint_manager in checkpoint_managers.items():
+            # 获取统计信息
+            stats = checkpoint_manager.get_stats(demo_province)
+            logger.info(f"\n===== 数据源 {data_source} 处理统计 =====")
+            logger.info(f"总任务数: {stats['total_tasks']}")
+            logger.info(f"已完成任务数: {stats['completed_tasks']}")
+            logger.info(f"失败任务数: {stats['failed_tasks']}")
+            
+            # 获取已完成的任务
+            completed_tasks = checkpoint_manager.get_completed_tasks(demo_province)
+            logger.info(f"已完成的城市数: {len(completed_tasks)}")
+            
+            # 获取失败的任务
+            failed_tasks = checkpoint_manager.get_failed_tasks(demo_province)
+            logger.info(f"失败的城市数: {len(failed_tasks)}")
     
     # 演示合并断点数据
     logger.info("\n===== 演示合并断点数据 =====\n")
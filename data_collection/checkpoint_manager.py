@@ -2,24 +2,203 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
 import json
+import queue
+import sqlite3
 import threading
 import logging
-from typing import Dict, List, Set, Any, Optional, Union, Tuple
+import time
+from functools import lru_cache
+from typing import Dict, List, Set, Any, Optional, Union, Tuple, BinaryIO, Iterable
 from datetime import datetime
 from pathlib import Path
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'checkpoint_manager.log')),
-        logging.StreamHandler()
-    ]
-)
+# 日志由调用方（采集脚本）统一配置，模块内只获取logger
 logger = logging.getLogger(__name__)
 
+# 紧凑的JSON分隔符，省去缩进和多余空格，减少序列化和写盘的开销
+JSON_SEPARATORS = (',', ':')
+
+# 已完成位图的起始年份，年份 y 对应第 (y - YEAR_BASE) 位；历史数据可能早于2000年，因此取1900
+YEAR_BASE = 1900
+
+# SQLite 存储后端的数据库文件名，位于断点目录下，所有数据源共用
+CHECKPOINT_DB_NAME = 'checkpoints.db'
+
+# SQLite 存储后端的表结构：ckpt 保存每个城市-年份对的完成/失败记录，meta 保存断点的统计等元数据
+CHECKPOINT_DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ckpt (
+    data_source TEXT NOT NULL,
+    city TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    province TEXT,
+    ts TEXT,
+    reason TEXT,
+    PRIMARY KEY (data_source, city, year, status)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    data_source TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (data_source, scope)
+);
+"""
+
+# 项目根目录，在导入时解析一次
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# 城市列表文件，用于构建城市到省份的反向索引
+CITY_LIST_PATH = PROJECT_ROOT / 'city_list.json'
+
+# 默认的断点文件存储目录
+DEFAULT_CHECKPOINT_DIR = PROJECT_ROOT / 'storage' / 'checkpoints'
+
+
+def _json_default(obj: Any) -> Any:
+    """
+    JSON序列化的回调函数，在编码过程中将集合转换为列表，无需预先复制断点数据
+    
+    参数:
+        obj (Any): json 无法直接序列化的对象
+        
+    返回:
+        Any: 可序列化的对象
+    """
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"无法序列化类型 {type(obj).__name__}")
+
+
+@lru_cache(maxsize=64)
+def checkpoint_file_path(checkpoint_dir: Path, data_source: str, suffix: str = '.json') -> Path:
+    """
+    拼接断点文件路径，结果会被缓存，避免重复格式化字符串和拼接路径
+    
+    参数:
+        checkpoint_dir (Path): 断点文件存储目录
+        data_source (str): 数据源名称
+        suffix (str): 文件后缀，快照为 .json，增量日志为 .log
+        
+    返回:
+        Path: 断点文件路径
+    """
+    return checkpoint_dir / f"{data_source}_checkpoint{suffix}"
+
+
+def open_checkpoint_db(db_path: Path) -> sqlite3.Connection:
+    """
+    打开断点数据库，启用WAL模式以支持多个进程同时读写
+    
+    参数:
+        db_path (Path): 数据库文件路径
+        
+    返回:
+        sqlite3.Connection: 数据库连接，由调用方通过锁保证同一时间只有一个线程使用
+    """
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(CHECKPOINT_DB_SCHEMA)
+    conn.commit()
+    return conn
+
+
+def check_year(year: int) -> None:
+    """
+    检查年份能否在已完成位图中表示
+    
+    参数:
+        year (int): 年份
+        
+    异常:
+        ValueError: 年份早于 YEAR_BASE
+    """
+    if year < YEAR_BASE:
+        raise ValueError(f"年份 {year} 早于支持的最早年份 {YEAR_BASE}")
+
+
+def year_bit(year: int) -> int:
+    """
+    获取年份在已完成位图中对应的位
+    
+    参数:
+        year (int): 年份
+        
+    返回:
+        int: 只有该年份对应位为1的整数
+        
+    异常:
+        ValueError: 年份早于 YEAR_BASE
+    """
+    check_year(year)
+    return 1 << (year - YEAR_BASE)
+
+
+def years_to_bits(years: Iterable[int], base: int = YEAR_BASE) -> int:
+    """
+    将年份集合压缩为一个整数位图
+    
+    参数:
+        years (Iterable[int]): 年份集合
+        base (int): 位图第0位对应的年份
+        
+    返回:
+        int: 年份位图
+    """
+    bits = 0
+    for year in years:
+        bits |= 1 << (year - base)
+    return bits
+
+
+def bits_to_years(bits: int, base: int = YEAR_BASE) -> List[int]:
+    """
+    将整数位图展开为按升序排列的年份列表
+    
+    参数:
+        bits (int): 年份位图
+        base (int): 位图第0位对应的年份
+        
+    返回:
+        List[int]: 年份列表
+    """
+    years = []
+    while bits:
+        low = bits & -bits
+        years.append(base + low.bit_length() - 1)
+        bits ^= low
+    return years
+
+
+@lru_cache(maxsize=1)
+def load_city_list() -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    从city_list.json加载城市列表，每个进程只读取一次文件
+    
+    返回的字典在多次调用间共享，调用方不应修改
+    
+    返回:
+        Dict: 城市列表字典，格式为 {省份: {城市: {latitude, longitude}}}，加载失败时返回空字典
+    """
+    try:
+        return json.loads(CITY_LIST_PATH.read_bytes())['city']
+    except Exception as e:
+        logger.error("加载城市列表时出错: %s", e)
+        return {}
+
+
+@lru_cache(maxsize=1)
+def city_to_province() -> Dict[str, str]:
+    """
+    构建城市到省份的反向索引，与城市列表一样每个进程只构建一次
+    
+    返回:
+        Dict[str, str]: 城市名称到省份名称的映射
+    """
+    return {city: province for province, cities in load_city_list().items() for city in cities}
+
 
 class CheckpointManager:
     """
@@ -28,13 +207,20 @@ class CheckpointManager:
     提供线程安全的操作，支持并发环境
     """
     
-    def __init__(self, data_source: str, checkpoint_dir: Optional[str] = None):
+    def __init__(self, data_source: str, checkpoint_dir: Optional[str] = None, batch_threshold: int = 128,
+                 background_writes: bool = False, durable: bool = False, backend: str = 'json',
+                 flush_interval: Optional[float] = None):
         """
         初始化断点管理器
         
         参数:
             data_source (str): 数据源名称，如 'openweather', 'visualcrossing' 等
             checkpoint_dir (Optional[str]): 断点文件存储目录，默认为项目根目录下的 storage/checkpoints
+            batch_threshold (int): 累积多少个尚未写盘的事件后批量写盘，默认为128
+            background_writes (bool): 是否由后台线程写入断点快照，调用方只负责序列化，默认为False
+            durable (bool): 追加增量日志和写入快照后是否调用 fsync 确保数据落盘，默认为False
+            backend (str): 存储后端，'json' 为快照文件加增量日志，'sqlite' 为断点目录下的 SQLite 数据库
+            flush_interval (Optional[float]): 距上次写盘超过多少秒时，即使未达到批量阈值也写盘，默认为None（只按数量）
         """
         self.data_source = data_source
         
@@ -43,122 +229,338 @@ class CheckpointManager:
             self.checkpoint_dir = Path(checkpoint_dir)
         else:
             # 默认存储在项目根目录下的 storage/checkpoints 目录
-            self.checkpoint_dir = Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) / 'storage' / 'checkpoints'
+            self.checkpoint_dir = DEFAULT_CHECKPOINT_DIR
         
         # 确保目录存在
         self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
         
-        # 线程锁，用于保证并发环境下的线程安全
+        # 线程锁，用于保证并发环境下的线程安全；每个数据源只有一份断点数据，一把锁即可
         self.lock = threading.RLock()
         
-        # 缓存已加载的断点数据，避免频繁IO操作
-        self._checkpoint_cache = {}
+        # 已加载的断点数据，省份和省份-年份级别的断点都是从中筛选出的视图
+        self._checkpoint: Optional[Dict[str, Any]] = None
+        
+        # 上次写盘后新增的事件数，达到批量阈值时写盘以减少IO
+        self._pending_events = 0
+        self._batch_threshold = batch_threshold
+        self._flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        
+        # 已打开的增量日志文件句柄，避免每个事件重复打开文件
+        self._log_file: Optional[BinaryIO] = None
+        
+        # 是否在替换快照文件前执行 fsync；增量日志也只在批量标记后 fsync 一次，不影响单个事件的开销
+        self._durable = durable
+        
+        # 已完成任务的只读位图，每个城市一个整数，写入方在锁内整体替换，is_completed 无需加锁即可读取
+        self._completed_snapshot: Optional[Dict[str, int]] = None
         
-        logger.info(f"断点管理器初始化完成，数据源: {data_source}, 断点目录: {self.checkpoint_dir}")
+        # 当前批次的时间戳字符串，同一批次内的事件共用，写盘后清空
+        self._now_cache: Optional[str] = None
+        
+        # 城市到省份的反向索引，用于筛选省份/年份视图
+        self._city_to_province = city_to_province()
+        
+        # SQLite 存储后端的连接，以及尚未提交的完成/失败记录，写盘时一次性提交
+        if backend not in ('json', 'sqlite'):
+            raise ValueError(f"不支持的存储后端: {backend}")
+        self._backend = backend
+        self._db: Optional[sqlite3.Connection] = None
+        self._pending_rows: List[Tuple[Any, ...]] = []
+        if backend == 'sqlite':
+            self._db = open_checkpoint_db(self.checkpoint_dir / CHECKPOINT_DB_NAME)
+        
+        # 后台写盘线程及其队列，队列元素为 (序列化数据, 日志序号)
+        # SQLite 后端每次写盘只是一次事务提交，不需要后台线程
+        self._write_queue: Optional[queue.Queue] = None
+        self._writer: Optional[threading.Thread] = None
+        if background_writes and self._db is None:
+            self._write_queue = queue.Queue()
+            self._writer = threading.Thread(target=self._writer_loop, name=f"checkpoint-writer-{data_source}", daemon=True)
+            self._writer.start()
+        
+        logger.info("断点管理器初始化完成，数据源: %s, 断点目录: %s", data_source, self.checkpoint_dir)
     
-    def _get_checkpoint_path(self, province: Optional[str] = None, year: Optional[int] = None) -> Path:
+    def _get_checkpoint_path(self) -> Path:
         """
-        获取断点文件路径
+        获取断点文件路径，每个数据源只有一个断点文件
         
-        参数:
-            province (Optional[str]): 省份名称，如果为None则返回数据源级别的断点文件
-            year (Optional[int]): 年份，如果为None则返回省份级别的断点文件
-            
         返回:
             Path: 断点文件路径
         """
-        if province is None:
-            # 数据源级别的断点文件
-            return self.checkpoint_dir / f"{self.data_source}_checkpoint.json"
-        elif year is None:
-            # 省份级别的断点文件
-            return self.checkpoint_dir / f"{self.data_source}_{province}_checkpoint.json"
-        else:
-            # 省份+年份级别的断点文件
-            return self.checkpoint_dir / f"{self.data_source}_{province}_{year}_checkpoint.json"
+        return checkpoint_file_path(self.checkpoint_dir, self.data_source)
+    
+    def _get_log_path(self) -> Path:
+        """
+        获取断点增量日志文件路径，日志与断点快照文件一一对应
+        
+        返回:
+            Path: 增量日志文件路径
+        """
+        return checkpoint_file_path(self.checkpoint_dir, self.data_source, '.log')
     
-    def _get_cache_key(self, province: Optional[str] = None, year: Optional[int] = None) -> str:
+    def _get_scope_key(self, province: str, year: Optional[int] = None) -> str:
         """
-        获取缓存键
+        获取省份或省份-年份范围的键，用于保存该范围的总任务数
         
         参数:
-            province (Optional[str]): 省份名称
+            province (str): 省份名称
             year (Optional[int]): 年份
-            
+        
         返回:
-            str: 缓存键
+            str: 范围键
         """
-        if province is None:
-            return f"{self.data_source}"
-        elif year is None:
-            return f"{self.data_source}_{province}"
-        else:
-            return f"{self.data_source}_{province}_{year}"
+        if year is None:
+            return province
+        return f"{province}_{year}"
     
     def load_checkpoint(self, province: Optional[str] = None, year: Optional[int] = None) -> Dict[str, Any]:
         """
         加载断点数据
         
+        数据源级别的断点是唯一的真实数据，省份和省份-年份级别的断点
+        是从中按需筛选出的视图，修改视图不会影响已保存的断点
+        
         参数:
             province (Optional[str]): 省份名称，如果为None则加载数据源级别的断点
             year (Optional[int]): 年份，如果为None则加载省份级别的断点
-            
+        
         返回:
             Dict[str, Any]: 断点数据
         """
-        cache_key = self._get_cache_key(province, year)
+        if province is None:
+            return self._load_snapshot()
+        return self._build_view(province, year)
+    
+    def _province_of(self, city: str, source_checkpoint: Dict[str, Any]) -> Optional[str]:
+        """
+        查询城市所属的省份，优先使用标记时显式传入的省份
         
-        # 使用线程锁确保线程安全
+        参数:
+            city (str): 城市名称
+            source_checkpoint (Dict[str, Any]): 数据源级别的断点数据
+        
+        返回:
+            Optional[str]: 省份名称，未知时返回None
+        """
+        province = source_checkpoint.get('provinces', {}).get(city)
+        if province is None:
+            province = self._city_to_province.get(city)
+        return province
+    
+    def _build_view(self, province: str, year: Optional[int] = None) -> Dict[str, Any]:
+        """
+        从数据源级别的断点中筛选出省份或省份-年份级别的断点视图
+        
+        参数:
+            province (str): 省份名称
+            year (Optional[int]): 年份，如果为None则返回整个省份的视图
+        
+        返回:
+            Dict[str, Any]: 断点视图，统计信息按筛选结果计算
+        """
         with self.lock:
-            # 检查缓存中是否已有数据
-            if cache_key in self._checkpoint_cache:
-                logger.debug(f"从缓存加载断点数据: {cache_key}")
-                return self._checkpoint_cache[cache_key]
+            source_checkpoint = self._load_snapshot()
+            
+            completed = {}
+            for city, years in source_checkpoint.get('completed', {}).items():
+                if self._province_of(city, source_checkpoint) != province:
+                    continue
+                if year is None:
+                    completed[city] = set(years)
+                elif year in years:
+                    completed[city] = {year}
             
-            checkpoint_path = self._get_checkpoint_path(province, year)
+            failed = {}
+            for city, years_data in source_checkpoint.get('failed', {}).items():
+                if self._province_of(city, source_checkpoint) != province:
+                    continue
+                if year is None:
+                    failed[city] = dict(years_data)
+                elif str(year) in years_data:
+                    failed[city] = {str(year): years_data[str(year)]}
             
-            # 检查断点文件是否存在
-            if checkpoint_path.exists():
+            view = {
+                "data_source": self.data_source,
+                "province": province,
+                "last_updated": source_checkpoint.get('last_updated'),
+                "completed": completed,
+                "failed": failed,
+                "stats": {
+                    "total_tasks": source_checkpoint.get('scope_totals', {}).get(self._get_scope_key(province, year), 0),
+                    "completed_tasks": sum(len(years) for years in completed.values()),
+                    "failed_tasks": sum(len(years_data) for years_data in failed.values())
+                }
+            }
+            if year is not None:
+                view["year"] = year
+            return view
+    
+    def _load_snapshot(self) -> Dict[str, Any]:
+        """
+        加载断点快照并重放增量日志，结果会被缓存
+        
+        返回:
+            Dict[str, Any]: 断点快照数据
+        """
+        # 已加载时直接返回，不需要加锁
+        checkpoint_data = self._checkpoint
+        if checkpoint_data is not None:
+            return checkpoint_data
+        
+        with self.lock:
+            if self._checkpoint is not None:
+                return self._checkpoint
+            
+            if self._db is not None:
+                checkpoint_data = self._read_snapshot_db()
+            else:
+                checkpoint_data = self._read_snapshot_file()
+            
+            # 如果文件不存在或加载失败，创建新的断点数据
+            if checkpoint_data is None:
+                checkpoint_data = self._create_new_checkpoint()
+            else:
+                # 加载时校准一次计数器，之后由标记操作增量维护
+                stats = checkpoint_data.setdefault('stats', {"total_tasks": 0})
+                stats['completed_tasks'] = sum(len(years) for years in checkpoint_data.get('completed', {}).values())
+                stats['failed_tasks'] = sum(len(years_data) for years_data in checkpoint_data.get('failed', {}).values())
+            
+            # 重放上次快照之后追加的事件，并在下次写盘时合并到快照中
+            if self._db is None:
                 try:
-                    with open(checkpoint_path, 'r', encoding='utf-8') as f:
-                        checkpoint_data = json.load(f)
-                        
-                    # 转换年份列表为集合，提高查找效率
-                    if 'completed' in checkpoint_data:
-                        for city, years in checkpoint_data['completed'].items():
-                            if isinstance(years, list):
-                                checkpoint_data['completed'][city] = set(years)
-                    
-                    # 缓存加载的数据
-                    self._checkpoint_cache[cache_key] = checkpoint_data
-                    logger.info(f"成功加载断点数据: {checkpoint_path}")
-                    return checkpoint_data
+                    self._pending_events += self._replay_log(checkpoint_data)
                 except Exception as e:
-                    logger.error(f"加载断点文件时出错: {str(e)}")
+                    logger.error("重放断点日志时出错: %s", e)
             
-            # 如果文件不存在或加载失败，创建新的断点数据
-            checkpoint_data = self._create_new_checkpoint(province, year)
-            self._checkpoint_cache[cache_key] = checkpoint_data
+            self._refresh_completed_snapshot(checkpoint_data)
+            self._checkpoint = checkpoint_data
             return checkpoint_data
     
-    def _create_new_checkpoint(self, province: Optional[str] = None, year: Optional[int] = None) -> Dict[str, Any]:
+    def _read_snapshot_file(self) -> Optional[Dict[str, Any]]:
         """
-        创建新的断点数据
+        从JSON快照文件读取断点数据
         
-        参数:
-            province (Optional[str]): 省份名称
-            year (Optional[int]): 年份
+        返回:
+            Optional[Dict[str, Any]]: 断点数据，文件不存在或读取失败时返回None
+        """
+        checkpoint_path = self._get_checkpoint_path()
+        
+        # 检查断点文件是否存在
+        if not checkpoint_path.exists():
+            return None
+        
+        try:
+            with open(checkpoint_path, 'rb') as f:
+                checkpoint_data = json.loads(f.read())
+            
+            # 快照中每个城市的已完成年份存为一个位图整数（旧版本为年份列表），加载时展开为集合；
+            # 城市名在各处重复出现，驻留后所有引用共享同一个字符串对象
+            completed_base = checkpoint_data.pop('completed_base', YEAR_BASE)
+            checkpoint_data['completed'] = {
+                sys.intern(city): set(bits_to_years(years, completed_base) if isinstance(years, int) else years)
+                for city, years in checkpoint_data.get('completed', {}).items()
+            }
+            for key in ('failed', 'provinces'):
+                if key in checkpoint_data:
+                    checkpoint_data[key] = {sys.intern(city): value for city, value in checkpoint_data[key].items()}
             
+            logger.info("成功加载断点数据: %s", checkpoint_path)
+            return checkpoint_data
+        except Exception as e:
+            logger.error("加载断点文件时出错: %s", e)
+            return None
+    
+    def _read_snapshot_db(self) -> Optional[Dict[str, Any]]:
+        """
+        从SQLite数据库读取断点元数据和全部完成/失败记录
+        
+        返回:
+            Optional[Dict[str, Any]]: 断点数据，数据库中没有记录或读取失败时返回None
+        """
+        try:
+            row = self._db.execute(
+                "SELECT data FROM meta WHERE data_source = ? AND scope = ?",
+                (self.data_source, self.data_source)
+            ).fetchone()
+            checkpoint_data = json.loads(row[0]) if row else None
+            
+            rows = self._db.execute(
+                "SELECT city, year, status, province, ts, reason FROM ckpt WHERE data_source = ?",
+                (self.data_source,)
+            ).fetchall()
+            if checkpoint_data is None:
+                if not rows:
+                    return None
+                checkpoint_data = self._create_new_checkpoint()
+            checkpoint_data['completed'] = {}
+            checkpoint_data['failed'] = {}
+            
+            # 数据库中的每条记录都等价于一个断点事件
+            for city, row_year, status, row_province, ts, reason in rows:
+                self._apply_event(checkpoint_data, {
+                    "op": status,
+                    "city": city,
+                    "year": row_year,
+                    "province": row_province,
+                    "timestamp": ts,
+                    "reason": reason
+                })
+            
+            logger.info("成功从数据库加载断点数据: %s，共 %d 条记录", self.data_source, len(rows))
+            return checkpoint_data
+        except Exception as e:
+            logger.error("从数据库加载断点数据时出错: %s", e)
+            return None
+    
+    def _write_snapshot_db(self, checkpoint_data: Dict[str, Any]) -> None:
+        """
+        将断点元数据和尚未提交的完成/失败记录写入SQLite数据库，在同一个事务中提交
+        
+        参数:
+            checkpoint_data (Dict[str, Any]): 断点数据
+        """
+        # 完成/失败记录逐条保存在 ckpt 表中，meta 表只保存其余字段
+        meta = {key: value for key, value in checkpoint_data.items() if key not in ('completed', 'failed', 'provinces')}
+        with self._db:
+            if self._pending_rows:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO ckpt (data_source, city, year, status, province, ts, reason) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self._pending_rows
+                )
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta (data_source, scope, data) VALUES (?, ?, ?)",
+                (self.data_source, self.data_source, json.dumps(meta, ensure_ascii=False, separators=JSON_SEPARATORS))
+            )
+        self._pending_rows.clear()
+    
+    def _refresh_completed_snapshot(self, checkpoint_data: Dict[str, Any]) -> None:
+        """
+        根据断点数据重建已完成任务的只读位图
+        
+        参数:
+            checkpoint_data (Dict[str, Any]): 数据源级别的断点数据
+        """
+        self._completed_snapshot = {
+            city: years_to_bits(years) for city, years in checkpoint_data.get('completed', {}).items()
+        }
+    
+    def _create_new_checkpoint(self) -> Dict[str, Any]:
+        """
+        创建新的断点数据
+        
         返回:
             Dict[str, Any]: 新的断点数据
         """
         checkpoint_data = {
             "data_source": self.data_source,
-            "created_at": datetime.now().isoformat(),
-            "last_updated": datetime.now().isoformat(),
+            "created_at": self._now(),
+            "last_updated": self._now(),
             "completed": {},
             "failed": {},
             "in_progress": {},
+            "scope_totals": {},
             "stats": {
                 "total_tasks": 0,
                 "completed_tasks": 0,
@@ -166,143 +568,394 @@ class CheckpointManager:
             }
         }
         
-        if province is not None:
-            checkpoint_data["province"] = province
-        
-        if year is not None:
-            checkpoint_data["year"] = year
-        
-        logger.info(f"创建新的断点数据: {self.data_source} {province or ''} {year or ''}")
+        logger.info("创建新的断点数据: %s", self.data_source)
         return checkpoint_data
     
-    def save_checkpoint(self, checkpoint_data: Dict[str, Any], province: Optional[str] = None, year: Optional[int] = None) -> bool:
+    def save_checkpoint(self, checkpoint_data: Optional[Dict[str, Any]] = None) -> bool:
         """
-        保存断点数据
+        保存断点数据快照，保存成功后清空增量日志
         
         参数:
-            checkpoint_data (Dict[str, Any]): 断点数据
-            province (Optional[str]): 省份名称
-            year (Optional[int]): 年份
-            
+            checkpoint_data (Optional[Dict[str, Any]]): 断点数据，默认为当前已加载的断点
+        
         返回:
             bool: 是否保存成功
         """
-        # 更新最后修改时间
-        checkpoint_data["last_updated"] = datetime.now().isoformat()
-        
-        # 将集合转换为列表以便JSON序列化
-        serializable_data = checkpoint_data.copy()
-        if 'completed' in serializable_data:
-            for city, years in serializable_data['completed'].items():
-                if isinstance(years, set):
-                    serializable_data['completed'][city] = list(years)
-        
-        checkpoint_path = self._get_checkpoint_path(province, year)
-        cache_key = self._get_cache_key(province, year)
+        checkpoint_path = self._get_checkpoint_path()
         
-        # 使用线程锁确保线程安全
+        # 序列化期间其他线程不能修改断点数据
         with self.lock:
+            if checkpoint_data is None:
+                checkpoint_data = self._load_snapshot()
+            
+            # 更新最后修改时间
+            checkpoint_data["last_updated"] = self._now()
+            
             try:
-                with open(checkpoint_path, 'w', encoding='utf-8') as f:
-                    json.dump(serializable_data, f, ensure_ascii=False, indent=2)
+                if self._db is not None:
+                    # SQLite 后端只提交新增的记录和元数据，不需要重新序列化整个断点
+                    self._write_snapshot_db(checkpoint_data)
+                else:
+                    # 一次性序列化后以二进制写入，已完成年份压缩为位图整数
+                    payload = json.dumps(self._snapshot_payload(checkpoint_data), ensure_ascii=False,
+                                         separators=JSON_SEPARATORS, default=_json_default).encode('utf-8')
+                    if self._write_queue is not None:
+                        # 交给后台线程写盘，增量日志在快照落盘后再清空
+                        self._write_queue.put((payload, checkpoint_data.get('log_seq', 0)))
+                    else:
+                        self._write_file(checkpoint_path, payload)
+                        
+                        # 快照已包含全部事件，清空增量日志
+                        self._truncate_log()
                 
-                # 更新缓存
-                self._checkpoint_cache[cache_key] = checkpoint_data
-                logger.debug(f"断点数据已保存: {checkpoint_path}")
+                self._checkpoint = checkpoint_data
+                self._pending_events = 0
+                self._refresh_completed_snapshot(checkpoint_data)
+                if logger.isEnabledFor(logging.DEBUG):
+                    # 统计记录数需要遍历全部城市，仅在开启DEBUG时计算
+                    completed_count = sum(len(years) for years in checkpoint_data['completed'].values())
+                    logger.debug("断点数据已保存: %s，已完成记录 %d 条", checkpoint_path, completed_count)
                 return True
             except Exception as e:
-                logger.error(f"保存断点文件时出错: {str(e)}")
+                logger.error("保存断点文件时出错: %s", e)
                 return False
     
+    def _snapshot_payload(self, checkpoint_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        生成写入JSON快照的数据，每个城市的已完成年份压缩为一个位图整数
+        
+        位图以所有已完成年份中最早的一年为第0位（记录在 completed_base 中），
+        使写出的整数尽量短
+        
+        参数:
+            checkpoint_data (Dict[str, Any]): 数据源级别的断点数据
+        
+        返回:
+            Dict[str, Any]: 待序列化的断点数据
+        """
+        completed = checkpoint_data.get('completed', {})
+        completed_base = min((min(years) for years in completed.values() if years), default=YEAR_BASE)
+        payload = dict(checkpoint_data)
+        payload['completed_base'] = completed_base
+        payload['completed'] = {city: years_to_bits(years, completed_base) for city, years in completed.items()}
+        return payload
+    
+    def _write_file(self, path: Path, payload: bytes) -> None:
+        """
+        先写入临时文件再原子替换，避免写到一半中断时损坏已有快照
+        
+        参数:
+            path (Path): 目标文件路径
+            payload (bytes): 文件内容
+        """
+        tmp_path = path.with_suffix(f'.tmp.{os.getpid()}')
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            if self._durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    
+    def _writer_loop(self) -> None:
+        """
+        后台写盘线程主循环，每次取出队列中积压的所有快照，只写最新的一份
+        """
+        checkpoint_path = self._get_checkpoint_path()
+        while True:
+            items = [self._write_queue.get()]
+            while True:
+                try:
+                    items.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            stop = None in items
+            snapshots = [item for item in items if item is not None]
+            if snapshots:
+                payload, log_seq = snapshots[-1]
+                try:
+                    self._write_file(checkpoint_path, payload)
+                    logger.debug("后台线程已写入断点数据: %s", checkpoint_path)
+                    
+                    # 快照写入期间没有新事件时才能清空增量日志，否则留到下次保存
+                    with self.lock:
+                        if self._checkpoint is None or self._checkpoint.get('log_seq', 0) == log_seq:
+                            self._truncate_log()
+                except Exception as e:
+                    logger.error("后台写入断点文件时出错: %s", e)
+            
+            for _ in items:
+                self._write_queue.task_done()
+            if stop:
+                return
+    
+    def _truncate_log(self) -> None:
+        """
+        关闭并删除增量日志文件，在快照写入成功后调用
+        """
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+        self._get_log_path().unlink(missing_ok=True)
+    
+    def _now(self) -> str:
+        """
+        获取当前批次的时间戳，避免每个事件都创建并格式化 datetime 对象
+        
+        返回:
+            str: ISO格式的时间戳
+        """
+        now = self._now_cache
+        if now is None:
+            now = self._now_cache = datetime.now().isoformat()
+        return now
+    
+    def _maybe_flush(self) -> bool:
+        """
+        尚未写盘的事件数达到批量阈值，或距上次写盘超过 flush_interval 秒时写盘
+        
+        返回:
+            bool: 是否保存成功（未达到阈值时返回True）
+        """
+        if self._pending_events >= self._batch_threshold:
+            return self.flush()
+        if self._flush_interval is not None and self._pending_events \
+                and time.monotonic() - self._last_flush >= self._flush_interval:
+            return self.flush()
+        return True
+    
+    def flush(self) -> bool:
+        """
+        将已修改但尚未写盘的断点数据保存到文件
+        
+        返回:
+            bool: 是否保存成功
+        """
+        with self.lock:
+            success = True
+            if self._pending_events and self._checkpoint is not None:
+                success = self.save_checkpoint(self._checkpoint)
+            
+            # 开始新的批次，下一个事件重新获取时间戳
+            self._now_cache = None
+            self._last_flush = time.monotonic()
+            return success
+    
+    def compact(self) -> bool:
+        """
+        将已加载的断点重新写成快照，并清空增量日志
+        
+        返回:
+            bool: 是否保存成功
+        """
+        with self.lock:
+            if self._checkpoint is None:
+                return True
+            return self.save_checkpoint(self._checkpoint)
+    
+    def close(self) -> None:
+        """
+        关闭断点管理器，保存所有未写盘的断点数据并关闭增量日志
+        """
+        self.flush()
+        
+        # 等待后台线程写完队列中的快照，期间不能持有锁，否则后台线程无法清空日志
+        if self._writer is not None:
+            self._write_queue.put(None)
+            self._writer.join()
+            self._writer = None
+            self._write_queue = None
+        
+        with self.lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+            
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+    
+    def __enter__(self) -> "CheckpointManager":
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+    
+    def _apply_event(self, checkpoint_data: Dict[str, Any], event: Dict[str, Any]) -> None:
+        """
+        将单个断点事件应用到断点数据上，标记操作与日志重放共用此逻辑
+        
+        参数:
+            checkpoint_data (Dict[str, Any]): 断点数据
+            event (Dict[str, Any]): 断点事件，op 为 'completed' 或 'failed'
+        """
+        city = sys.intern(event['city'])
+        year = event['year']
+        if 'seq' in event:
+            checkpoint_data['log_seq'] = event['seq']
+        if event.get('province'):
+            checkpoint_data.setdefault('provinces', {})[city] = event['province']
+        stats = checkpoint_data.setdefault('stats', {
+            "total_tasks": 0,
+            "completed_tasks": 0,
+            "failed_tasks": 0
+        })
+        
+        # 计数器随事件增量维护，重复标记同一城市-年份对时不重复计数
+        if event['op'] == 'completed':
+            years = checkpoint_data.setdefault('completed', {}).setdefault(city, set())
+            if year not in years:
+                years.add(year)
+                stats['completed_tasks'] += 1
+        elif event['op'] == 'failed':
+            years_data = checkpoint_data.setdefault('failed', {}).setdefault(city, {})
+            if str(year) not in years_data:
+                stats['failed_tasks'] += 1
+            years_data[str(year)] = {
+                "timestamp": event['timestamp'],
+                "reason": event['reason']
+            }
+    
+    def _append_events(self, events: List[Dict[str, Any]]) -> None:
+        """
+        以追加方式将断点事件写入增量日志，每个事件一行JSON，多个事件合并为一次写入
+        
+        参数:
+            events (List[Dict[str, Any]]): 断点事件列表
+        """
+        if self._db is not None:
+            # SQLite 后端先暂存记录，写盘时与元数据在同一个事务中提交
+            self._pending_rows.extend(
+                (self.data_source, event['city'], event['year'], event['op'],
+                 event.get('province'), event.get('timestamp'), event.get('reason'))
+                for event in events
+            )
+            return
+        
+        try:
+            if self._log_file is None:
+                self._log_file = open(self._get_log_path(), 'ab', buffering=0)
+            self._log_file.write(''.join(
+                json.dumps(event, ensure_ascii=False, separators=JSON_SEPARATORS) + '\n' for event in events
+            ).encode('utf-8'))
+            if self._durable:
+                # 每次追加都落盘，单个事件和批量事件一样可靠；批量标记的事件合并为一次写入，一批只 fsync 一次
+                os.fsync(self._log_file.fileno())
+        except Exception as e:
+            logger.error("写入断点日志时出错: %s", e)
+    
+    def _replay_log(self, checkpoint_data: Dict[str, Any]) -> int:
+        """
+        将增量日志中尚未合并到快照的事件重放到断点数据上
+        
+        参数:
+            checkpoint_data (Dict[str, Any]): 从快照加载的断点数据
+        
+        返回:
+            int: 重放的事件数
+        """
+        log_path = self._get_log_path()
+        if not log_path.exists():
+            return 0
+        
+        replayed = 0
+        with open(log_path, 'rb') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # 进程中断时最后一行可能写入不完整，跳过即可
+                    logger.warning("跳过无法解析的断点日志行: %s", log_path)
+                    continue
+                # 序号不大于快照中记录的事件已经包含在快照里
+                if event.get('seq', 0) and event['seq'] <= checkpoint_data.get('log_seq', 0):
+                    continue
+                self._apply_event(checkpoint_data, event)
+                replayed += 1
+        return replayed
+    
+    def _record_events(self, events: List[Dict[str, Any]]) -> None:
+        """
+        将断点事件应用到断点数据，并追加到增量日志，调用方需持有锁
+        
+        参数:
+            events (List[Dict[str, Any]]): 断点事件列表
+        """
+        # 先校验全部年份，避免事件已应用并写入日志后才因位图无法表示而出错，导致内存与日志不一致
+        for event in events:
+            check_year(event['year'])
+        
+        checkpoint_data = self._load_snapshot()
+        for event in events:
+            # 事件序号单调递增，后台写盘时用于判断快照已包含哪些日志事件
+            event['seq'] = checkpoint_data.get('log_seq', 0) + 1
+            self._apply_event(checkpoint_data, event)
+        self._append_events(events)
+        self._pending_events += len(events)
+        
+        # 复制后整体替换已完成位图，读取方看到的始终是完整的旧位图或新位图；
+        # 每次调用都要复制整个位图（与城市数成正比），大量标记应通过 mark_completed_batch 分摊复制开销
+        completed_events = [event for event in events if event['op'] == 'completed']
+        if completed_events:
+            if self._completed_snapshot is None:
+                self._refresh_completed_snapshot(checkpoint_data)
+            else:
+                snapshot = dict(self._completed_snapshot)
+                for event in completed_events:
+                    snapshot[event['city']] = snapshot.get(event['city'], 0) | year_bit(event['year'])
+                self._completed_snapshot = snapshot
+    
     def mark_completed(self, city: str, year: int, province: Optional[str] = None) -> bool:
         """
         标记城市-年份对为已完成
         
+        每次调用都会复制一次已完成位图，开销与城市数成正比；
+        需要逐个标记大量任务时请攒成一批调用 mark_completed_batch
+        
         参数:
             city (str): 城市名称
             year (int): 年份
-            province (Optional[str]): 省份名称，如果提供则同时更新省份级别的断点
-            
+            province (Optional[str]): 省份名称，可省略，默认按城市列表推断城市所属的省份
+        
         返回:
             bool: 是否标记成功
         """
+        event = {"op": "completed", "city": city, "year": year}
+        # 省份可以从城市列表推断，只有与城市列表不一致时才需要记录
+        if province and province != self._city_to_province.get(city):
+            event["province"] = province
+        
         # 使用线程锁确保线程安全
         with self.lock:
-            # 更新数据源级别的断点
-            source_checkpoint = self.load_checkpoint()
-            
-            if 'completed' not in source_checkpoint:
-                source_checkpoint['completed'] = {}
-            
-            if city not in source_checkpoint['completed']:
-                source_checkpoint['completed'][city] = set()
-            
-            source_checkpoint['completed'][city].add(year)
-            
-            # 更新统计信息
-            if 'stats' not in source_checkpoint:
-                source_checkpoint['stats'] = {
-                    "total_tasks": 0,
-                    "completed_tasks": 0,
-                    "failed_tasks": 0
-                }
-            
-            source_checkpoint['stats']['completed_tasks'] += 1
-            
-            # 保存数据源级别的断点
-            self.save_checkpoint(source_checkpoint)
+            self._record_events([event])
             
-            # 如果提供了省份，同时更新省份级别的断点
-            if province:
-                province_checkpoint = self.load_checkpoint(province)
-                
-                if 'completed' not in province_checkpoint:
-                    province_checkpoint['completed'] = {}
-                
-                if city not in province_checkpoint['completed']:
-                    province_checkpoint['completed'][city] = set()
-                
-                province_checkpoint['completed'][city].add(year)
-                
-                # 更新统计信息
-                if 'stats' not in province_checkpoint:
-                    province_checkpoint['stats'] = {
-                        "total_tasks": 0,
-                        "completed_tasks": 0,
-                        "failed_tasks": 0
-                    }
-                
-                province_checkpoint['stats']['completed_tasks'] += 1
-                
-                # 保存省份级别的断点
-                self.save_checkpoint(province_checkpoint, province)
-                
-                # 如果提供了年份，同时更新省份-年份级别的断点
-                year_checkpoint = self.load_checkpoint(province, year)
-                
-                if 'completed' not in year_checkpoint:
-                    year_checkpoint['completed'] = {}
-                
-                if city not in year_checkpoint['completed']:
-                    year_checkpoint['completed'][city] = set()
-                
-                year_checkpoint['completed'][city].add(year)
-                
-                # 更新统计信息
-                if 'stats' not in year_checkpoint:
-                    year_checkpoint['stats'] = {
-                        "total_tasks": 0,
-                        "completed_tasks": 0,
-                        "failed_tasks": 0
-                    }
-                
-                year_checkpoint['stats']['completed_tasks'] += 1
-                
-                # 保存省份-年份级别的断点
-                self.save_checkpoint(year_checkpoint, province, year)
-            
-            logger.info(f"已标记完成: {city} {year}年 (数据源: {self.data_source}, 省份: {province or 'N/A'})")
+            logger.info("已标记完成: %s %d年 (数据源: %s, 省份: %s)", city, year, self.data_source, province or 'N/A')
+            return self._maybe_flush()
+    
+    def mark_completed_batch(self, tasks: Iterable[Tuple[str, int, Optional[str]]]) -> bool:
+        """
+        批量标记城市-年份对为已完成，整批只加一次锁、写一次增量日志
+        
+        参数:
+            tasks (Iterable[Tuple[str, int, Optional[str]]]): (城市, 年份, 省份) 元组，省份可以为None
+        
+        返回:
+            bool: 是否标记成功
+        """
+        events = []
+        for city, year, province in tasks:
+            event = {"op": "completed", "city": city, "year": year}
+            if province and province != self._city_to_province.get(city):
+                event["province"] = province
+            events.append(event)
+        if not events:
             return True
+        
+        with self.lock:
+            self._record_events(events)
+            
+            logger.info("已批量标记完成 %d 个任务 (数据源: %s)", len(events), self.data_source)
+            return self._maybe_flush()
     
     def mark_failed(self, city: str, year: int, reason: str, province: Optional[str] = None) -> bool:
         """
@@ -312,70 +965,28 @@ class CheckpointManager:
             city (str): 城市名称
             year (int): 年份
             reason (str): 失败原因
-            province (Optional[str]): 省份名称，如果提供则同时更新省份级别的断点
-            
+            province (Optional[str]): 省份名称，可省略，默认按城市列表推断城市所属的省份
+        
         返回:
             bool: 是否标记成功
         """
+        event = {
+            "op": "failed",
+            "city": city,
+            "year": year,
+            "timestamp": self._now(),
+            "reason": reason
+        }
+        # 省份可以从城市列表推断，只有与城市列表不一致时才需要记录
+        if province and province != self._city_to_province.get(city):
+            event["province"] = province
+        
         # 使用线程锁确保线程安全
         with self.lock:
-            # 更新数据源级别的断点
-            source_checkpoint = self.load_checkpoint()
-            
-            if 'failed' not in source_checkpoint:
-                source_checkpoint['failed'] = {}
-            
-            if city not in source_checkpoint['failed']:
-                source_checkpoint['failed'][city] = {}
-            
-            source_checkpoint['failed'][city][str(year)] = {
-                "timestamp": datetime.now().isoformat(),
-                "reason": reason
-            }
-            
-            # 更新统计信息
-            if 'stats' not in source_checkpoint:
-                source_checkpoint['stats'] = {
-                    "total_tasks": 0,
-                    "completed_tasks": 0,
-                    "failed_tasks": 0
-                }
+            self._record_events([event])
             
-            source_checkpoint['stats']['failed_tasks'] += 1
-            
-            # 保存数据源级别的断点
-            self.save_checkpoint(source_checkpoint)
-            
-            # 如果提供了省份，同时更新省份级别的断点
-            if province:
-                province_checkpoint = self.load_checkpoint(province)
-                
-                if 'failed' not in province_checkpoint:
-                    province_checkpoint['failed'] = {}
-                
-                if city not in province_checkpoint['failed']:
-                    province_checkpoint['failed'][city] = {}
-                
-                province_checkpoint['failed'][city][str(year)] = {
-                    "timestamp": datetime.now().isoformat(),
-                    "reason": reason
-                }
-                
-                # 更新统计信息
-                if 'stats' not in province_checkpoint:
-                    province_checkpoint['stats'] = {
-                        "total_tasks": 0,
-                        "completed_tasks": 0,
-                        "failed_tasks": 0
-                    }
-                
-                province_checkpoint['stats']['failed_tasks'] += 1
-                
-                # 保存省份级别的断点
-                self.save_checkpoint(province_checkpoint, province)
-            
-            logger.info(f"已标记失败: {city} {year}年 (数据源: {self.data_source}, 省份: {province or 'N/A'})，原因: {reason}")
-            return True
+            logger.info("已标记失败: %s %d年 (数据源: %s, 省份: %s)，原因: %s", city, year, self.data_source, province or 'N/A', reason)
+            return self._maybe_flush()
     
     def is_completed(self, city: str, year: int, province: Optional[str] = None) -> bool:
         """
@@ -384,59 +995,109 @@ class CheckpointManager:
         参数:
             city (str): 城市名称
             year (int): 年份
-            province (Optional[str]): 省份名称，如果提供则优先检查省份级别的断点
-            
+            province (Optional[str]): 省份名称，保留以兼容旧调用，不再需要传入
+        
         返回:
             bool: 是否已完成
         """
-        # 使用线程锁确保线程安全
-        with self.lock:
-            # 如果提供了省份，优先检查省份级别的断点
-            if province:
-                province_checkpoint = self.load_checkpoint(province)
-                
-                if 'completed' in province_checkpoint and city in province_checkpoint['completed']:
-                    if isinstance(province_checkpoint['completed'][city], set):
-                        return year in province_checkpoint['completed'][city]
-                    elif isinstance(province_checkpoint['completed'][city], list):
-                        return year in province_checkpoint['completed'][city]
-            
-            # 检查数据源级别的断点
-            source_checkpoint = self.load_checkpoint()
-            
-            if 'completed' in source_checkpoint and city in source_checkpoint['completed']:
-                if isinstance(source_checkpoint['completed'][city], set):
-                    return year in source_checkpoint['completed'][city]
-                elif isinstance(source_checkpoint['completed'][city], list):
-                    return year in source_checkpoint['completed'][city]
-            
-            return False
+        # 快速路径：直接读取只读位图，不需要加锁
+        snapshot = self._completed_snapshot
+        if snapshot is None:
+            # 首次调用时加载断点，加载过程会建立位图
+            self._load_snapshot()
+            snapshot = self._completed_snapshot
+        
+        return bool(snapshot.get(city, 0) & year_bit(year))
+    
+    def pending_tasks(self, cities: Iterable[str], years: List[int]) -> List[Tuple[str, int]]:
+        """
+        批量筛选尚未完成的城市-年份对
+        
+        先把目标年份合成一个位掩码，每个城市只需一次位运算即可判断是否全部完成，
+        只有存在未完成年份的城市才会逐年展开
+        
+        参数:
+            cities (Iterable[str]): 城市名称
+            years (List[int]): 目标年份
+        
+        返回:
+            List[Tuple[str, int]]: 未完成的 (城市, 年份) 列表，按传入顺序排列
+        """
+        snapshot = self._completed_snapshot
+        if snapshot is None:
+            self._load_snapshot()
+            snapshot = self._completed_snapshot
+        
+        year_bits = [(year, year_bit(year)) for year in years]
+        target_mask = 0
+        for _, bit in year_bits:
+            target_mask |= bit
+        
+        pending = []
+        for city in cities:
+            missing = target_mask & ~snapshot.get(city, 0)
+            if missing:
+                pending.extend((city, year) for year, bit in year_bits if missing & bit)
+        return pending
     
     def is_failed(self, city: str, year: int, province: Optional[str] = None) -> bool:
         """
         检查城市-年份对是否失败
-
+        
         参数:
             city (str): 城市名称
             year (int): 年份
-            province (Optional[str]): 省份名称
-
+            province (Optional[str]): 省份名称，保留以兼容旧调用，不再需要传入
+        
         返回:
             bool: 是否失败
         """
         with self.lock:
-            checkpoint = self.load_checkpoint(province)
+            checkpoint = self._load_snapshot()
             if 'failed' in checkpoint and city in checkpoint['failed']:
                 return str(year) in checkpoint['failed'][city]
             return False
-
+    
+    def get_completed_set(self, year: int) -> Set[str]:
+        """
+        一次性取出某年份所有已完成的城市，代替逐个城市调用 is_completed
+        
+        参数:
+            year (int): 年份
+        
+        返回:
+            Set[str]: 该年份已完成的城市名称
+        """
+        snapshot = self._completed_snapshot
+        if snapshot is None:
+            self._load_snapshot()
+            snapshot = self._completed_snapshot
+        
+        bit = year_bit(year)
+        return {city for city, bits in snapshot.items() if bits & bit}
+    
+    def get_failed_set(self, year: int) -> Set[str]:
+        """
+        一次性取出某年份所有失败的城市，只加一次锁，代替逐个城市调用 is_failed
+        
+        参数:
+            year (int): 年份
+        
+        返回:
+            Set[str]: 该年份失败的城市名称
+        """
+        year_key = str(year)
+        with self.lock:
+            checkpoint = self._load_snapshot()
+            return {city for city, years in checkpoint.get('failed', {}).items() if year_key in years}
+    
     def get_completed_tasks(self, province: Optional[str] = None) -> Dict[str, Set[int]]:
         """
         获取已完成的任务列表
         
         参数:
             province (Optional[str]): 省份名称，如果提供则返回该省份的已完成任务
-            
+        
         返回:
             Dict[str, Set[int]]: 已完成的城市-年份对，格式为 {城市: {年份1, 年份2, ...}}
         """
@@ -466,7 +1127,7 @@ class CheckpointManager:
         
         参数:
             province (Optional[str]): 省份名称，如果提供则返回该省份的失败任务
-            
+        
         返回:
             Dict[str, Dict[str, Dict[str, str]]]: 失败的城市-年份对及失败原因
         """
@@ -489,7 +1150,7 @@ class CheckpointManager:
         参数:
             province (Optional[str]): 省份名称
             year (Optional[int]): 年份
-            
+        
         返回:
             Dict[str, int]: 统计信息
         """
@@ -512,52 +1173,34 @@ class CheckpointManager:
         
         参数:
             total_tasks (Optional[int]): 总任务数
-            province (Optional[str]): 省份名称
+            province (Optional[str]): 省份名称，如果提供则更新该省份（或省份-年份）的总任务数
             year (Optional[int]): 年份
-            
+        
         返回:
             bool: 是否更新成功
         """
         # 使用线程锁确保线程安全
         with self.lock:
-            checkpoint = self.load_checkpoint(province, year)
-            
-            if 'stats' not in checkpoint:
-                checkpoint['stats'] = {
-                    "total_tasks": 0,
-                    "completed_tasks": 0,
-                    "failed_tasks": 0
-                }
+            checkpoint = self._load_snapshot()
             
+            # 已完成和失败的任务数由标记操作增量维护，这里只需要更新总任务数
             if total_tasks is not None:
-                checkpoint['stats']['total_tasks'] = total_tasks
-            
-            # 重新计算已完成和失败的任务数
-            completed_count = 0
-            if 'completed' in checkpoint:
-                for city, years in checkpoint['completed'].items():
-                    if isinstance(years, set):
-                        completed_count += len(years)
-                    elif isinstance(years, list):
-                        completed_count += len(years)
-            
-            failed_count = 0
-            if 'failed' in checkpoint:
-                for city, years_data in checkpoint['failed'].items():
-                    failed_count += len(years_data)
-            
-            checkpoint['stats']['completed_tasks'] = completed_count
-            checkpoint['stats']['failed_tasks'] = failed_count
+                if province is None:
+                    checkpoint.setdefault('stats', {})['total_tasks'] = total_tasks
+                else:
+                    checkpoint.setdefault('scope_totals', {})[self._get_scope_key(province, year)] = total_tasks
             
             # 保存更新后的断点
-            return self.save_checkpoint(checkpoint, province, year)
+            return self.save_checkpoint(checkpoint)
     
     def clear_cache(self) -> None:
         """
-        清除缓存
+        清除缓存，清除前会先保存尚未写盘的断点数据
         """
         with self.lock:
-            self._checkpoint_cache.clear()
+            self.flush()
+            self._checkpoint = None
+            self._completed_snapshot = None
             logger.debug("断点缓存已清除")
     
     def merge_checkpoints(self, source_data_source: str) -> bool:
@@ -566,53 +1209,69 @@ class CheckpointManager:
         
         参数:
             source_data_source (str): 源数据源名称
-            
+        
         返回:
             bool: 是否合并成功
         """
         try:
-            # 创建临时的断点管理器来加载源数据源的断点
-            source_manager = CheckpointManager(source_data_source, str(self.checkpoint_dir))
-            source_checkpoint = source_manager.load_checkpoint()
+            # 创建临时的断点管理器来加载源数据源的断点，使用相同的存储后端
+            with CheckpointManager(source_data_source, str(self.checkpoint_dir), backend=self._backend) as source_manager:
+                source_checkpoint = source_manager.load_checkpoint()
             
-            # 加载当前数据源的断点
-            target_checkpoint = self.load_checkpoint()
-            
-            # 合并已完成的任务
-            if 'completed' in source_checkpoint:
-                if 'completed' not in target_checkpoint:
-                    target_checkpoint['completed'] = {}
+            with self.lock:
+                # 加载当前数据源的断点
+                target_checkpoint = self.load_checkpoint()
+                target_completed = target_checkpoint.setdefault('completed', {})
+                source_provinces = source_checkpoint.get('provinces', {})
+                snapshot = dict(self._completed_snapshot or {})
+                merged = 0
                 
-                for city, years in source_checkpoint['completed'].items():
-                    if city not in target_checkpoint['completed']:
-                        target_checkpoint['completed'][city] = set()
+                # 合并已完成的任务，每个城市只做一次集合差与并运算，不逐年记录事件
+                for city, years in source_checkpoint.get('completed', {}).items():
+                    target_years = target_completed.get(city, frozenset())
+                    new_years = years - target_years
+                    if not new_years:
+                        continue
+                    target_completed[city] = target_years | new_years
                     
-                    if isinstance(years, set):
-                        target_checkpoint['completed'][city].update(years)
-                    elif isinstance(years, list):
-                        target_checkpoint['completed'][city].update(set(years))
-            
-            # 保存更新后的断点
-            self.save_checkpoint(target_checkpoint)
+                    bits = snapshot.get(city, 0)
+                    for year in new_years:
+                        bits |= year_bit(year)
+                    snapshot[city] = bits
+                    
+                    province = source_provinces.get(city)
+                    if province:
+                        target_checkpoint.setdefault('provinces', {})[city] = province
+                    if self._db is not None:
+                        self._pending_rows.extend(
+                            (self.data_source, city, year, 'completed', province, None, None) for year in new_years
+                        )
+                    merged += len(new_years)
+                
+                target_checkpoint['stats']['completed_tasks'] += merged
+                self._completed_snapshot = snapshot
+                self._pending_events += merged
+                
+                # 合并的记录没有写入增量日志，立即保存快照
+                self.flush()
             
-            logger.info(f"成功合并来自 {source_data_source} 的断点数据到 {self.data_source}")
+            logger.info("成功合并来自 %s 的断点数据到 %s", source_data_source, self.data_source)
             return True
         except Exception as e:
-            logger.error(f"合并断点数据时出错: {str(e)}")
+            logger.error("合并断点数据时出错: %s", e)
             return False
 
 
 # 示例用法
 def example_usage():
-    # 创建断点管理器
-    checkpoint_manager = CheckpointManager("openweather")
-    
-    # 标记任务完成
-    checkpoint_manager.mark_completed("北京", 2020, "北京市")
-    checkpoint_manager.mark_completed("上海", 2020, "上海市")
-    
-    # 标记任务失败
-    checkpoint_manager.mark_failed("广州", 2020, "API请求超时", "广东省")
+    # 创建断点管理器，退出 with 语句块时自动保存未写盘的断点
+    with CheckpointManager("openweather") as checkpoint_manager:
+        # 标记任务完成
+        checkpoint_manager.mark_completed("北京", 2020, "北京市")
+        checkpoint_manager.mark_completed("上海", 2020, "上海市")
+        
+        # 标记任务失败
+        checkpoint_manager.mark_failed("广州", 2020, "API请求超时", "广东省")
     
     # 检查任务是否完成
     is_completed = checkpoint_manager.is_completed("北京", 2020)
@@ -632,4 +1291,5 @@ def example_usage():
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     example_usage()
\ No newline at end of file
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+HTTP条件请求缓存
+
+保存带有 ETag / Last-Modified 的响应体，再次请求同一地址时附带 If-None-Match /
+If-Modified-Since 请求头，服务器返回 304 Not Modified 时直接使用缓存的响应体，
+省去重复下载整段数据
+"""
+
+import sqlite3
+import threading
+import itertools
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional, Iterable, Tuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# 缓存数据库路径
+HTTP_CACHE_PATH = Path(__file__).parent / 'cache' / 'http_cache.sqlite'
+
+# 不参与缓存键计算的查询参数（API密钥等），避免更换密钥后缓存失效或密钥写入缓存
+SECRET_PARAMS = frozenset({'appid', 'key', 'apikey', 'api_key'})
+
+# 缓存条目的有效期（秒），过期的条目不再用于条件请求，并在清理时删除
+HTTP_CACHE_TTL_SECONDS = 30 * 24 * 3600
+
+# 缓存最多保留的条目数，超出时删除最早写入的条目
+HTTP_CACHE_MAX_ENTRIES = 20000
+
+# 每写入多少个条目清理一次过期和超出上限的条目
+PRUNE_INTERVAL = 500
+
+# 每个线程各用一个数据库连接，读取互不阻塞（WAL模式），写入由SQLite自身排队，不再共用一把进程级的锁
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+_store_counter = itertools.count(1)
+
+
+def _get_cache_db() -> sqlite3.Connection:
+    """
+    打开当前线程的缓存数据库连接，首次调用时建表
+
+    返回:
+        sqlite3.Connection: 当前线程专用的数据库连接
+    """
+    global _schema_ready
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        HTTP_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(HTTP_CACHE_PATH), timeout=30)
+        with _schema_lock:
+            if not _schema_ready:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS http_cache ("
+                    "key TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body BLOB, ts INTEGER)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS http_cache_ts ON http_cache (ts)")
+                conn.commit()
+                _schema_ready = True
+        _local.conn = conn
+    return conn
+
+
+def cache_key(url: str, params: Optional[Dict[str, Any]] = None, exclude: Iterable[str] = SECRET_PARAMS) -> str:
+    """
+    根据请求地址和查询参数生成缓存键，参数按名称排序，忽略密钥类参数
+
+    参数:
+        url (str): 请求地址
+        params (Optional[Dict[str, Any]]): 查询参数
+        exclude (Iterable[str]): 不参与缓存键计算的参数名
+
+    返回:
+        str: 缓存键
+    """
+    if not params:
+        return url
+    excluded = frozenset(exclude)
+    query = '&'.join(f"{name}={value}" for name, value in sorted(params.items()) if name not in excluded)
+    return f"{url}?{query}"
+
+
+def _lookup(key: str) -> Optional[Tuple[Optional[str], Optional[str], bytes]]:
+    """
+    查询缓存条目
+
+    参数:
+        key (str): 缓存键
+
+    返回:
+        Optional[Tuple[Optional[str], Optional[str], bytes]]: (ETag, Last-Modified, 响应体)，未命中或已过期时返回None
+    """
+    try:
+        return _get_cache_db().execute(
+            "SELECT etag, last_modified, body FROM http_cache WHERE key = ? AND ts >= ?",
+            (key, int(time.time()) - HTTP_CACHE_TTL_SECONDS)
+        ).fetchone()
+    except sqlite3.Error as e:
+        logger.error("读取HTTP缓存失败: %s", e)
+        return None
+
+
+def _prune(conn: sqlite3.Connection) -> None:
+    """
+    删除过期的条目，以及超出 HTTP_CACHE_MAX_ENTRIES 的最早写入的条目
+
+    参数:
+        conn (sqlite3.Connection): 当前线程的数据库连接
+    """
+    conn.execute("DELETE FROM http_cache WHERE ts < ?", (int(time.time()) - HTTP_CACHE_TTL_SECONDS,))
+    conn.execute(
+        "DELETE FROM http_cache WHERE key IN "
+        "(SELECT key FROM http_cache ORDER BY ts DESC LIMIT -1 OFFSET ?)",
+        (HTTP_CACHE_MAX_ENTRIES,)
+    )
+    conn.commit()
+
+
+def _store(key: str, etag: Optional[str], last_modified: Optional[str], body: bytes) -> None:
+    """
+    写入缓存条目
+
+    参数:
+        key (str): 缓存键
+        etag (Optional[str]): 响应的 ETag
+        last_modified (Optional[str]): 响应的 Last-Modified
+        body (bytes): 响应体
+    """
+    try:
+        conn = _get_cache_db()
+        conn.execute(
+            "INSERT OR REPLACE INTO http_cache (key, etag, last_modified, body, ts) VALUES (?, ?, ?, ?, ?)",
+            (key, etag, last_modified, body, int(time.time()))
+        )
+        conn.commit()
+        # 定期清理，缓存不会无限增长
+        if next(_store_counter) % PRUNE_INTERVAL == 0:
+            _prune(conn)
+    except sqlite3.Error as e:
+        logger.error("写入HTTP缓存失败: %s", e)
+
+
+def conditional_get(session: requests.Session, url: str, params: Optional[Dict[str, Any]] = None,
+                    **kwargs: Any) -> requests.Response:
+    """
+    发送GET请求，已缓存的地址附带条件请求头；服务器返回304时用缓存的响应体补全响应
+
+    参数:
+        session (requests.Session): 发送请求的会话
+        url (str): 请求地址
+        params (Optional[Dict[str, Any]]): 查询参数
+        **kwargs: 传给 session.get 的其他参数（如 timeout）
+
+    返回:
+        requests.Response: 响应对象，304时状态码改为200、内容为缓存的响应体
+    """
+    key = cache_key(url, params)
+    cached = _lookup(key)
+
+    headers = dict(kwargs.pop('headers', None) or {})
+    if cached is not None:
+        etag, last_modified, _ = cached
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+    response = session.get(url, params=params, headers=headers, **kwargs)
+
+    if response.status_code == 304 and cached is not None:
+        # 数据未变化，使用缓存的响应体
+        response.status_code = 200
+        response._content = cached[2]
+        logger.debug("HTTP缓存命中(304): %s", key)
+        return response
+
+    if response.status_code == 200:
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        # 只有带校验信息的响应才能在下次请求时重新验证
+        if etag or last_modified:
+            _store(key, etag, last_modified, response.content)
+
+    return response
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+HTTP响应处理的通用工具函数
+"""
+
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+# Retry-After 给出的等待时间上限（秒），避免异常的响应头让线程长时间挂起
+MAX_RETRY_AFTER = 60.0
+
+
+def parse_retry_after(value: Optional[str], max_wait: float = MAX_RETRY_AFTER) -> Optional[float]:
+    """
+    解析 Retry-After 响应头，支持秒数和HTTP日期两种格式
+
+    参数:
+        value (Optional[str]): Retry-After 响应头的值
+        max_wait (float): 等待时间上限（秒）
+
+    返回:
+        Optional[float]: 需要等待的秒数，响应头缺失或无法解析时返回None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return None
+    return min(max(seconds, 0.0), max_wait)
@@ -1,18 +1,49 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 import json
 import time
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple, Callable, Awaitable, Optional, BinaryIO
 
 try:
     from geopy.geocoders import Nominatim
+    from geopy.extra.rate_limiter import AsyncRateLimiter
+    from geopy.exc import GeocoderTimedOut, GeocoderUnavailable, GeocoderRateLimited, GeocoderQuotaExceeded
 except ImportError:
     print("请先安装geopy库: pip install geopy")
     exit(1)
 
 
+# 同时进行中的地理编码请求数上限，请求之间仍由限速器保证至少间隔 GEOCODE_MIN_DELAY 秒，
+# 并发只用于重叠各请求的网络往返时间
+GEOCODE_CONCURRENCY = 10
+
+# Nominatim 使用政策要求每秒最多一次请求
+GEOCODE_MIN_DELAY = 1.0
+
+# 地理编码结果缓存，跨多次运行复用已查询过的城市
+GEOCODE_CACHE_PATH = Path(__file__).parent / "geocode_cache.sqlite"
+
+# 经纬度增量日志，每获取到一个城市的经纬度就追加一行，城市列表只在运行结束时整体保存一次
+GEOCODE_JOURNAL_PATH = Path(__file__).parent / "geocode_progress.ndjson"
+
+# 城市信息中表示已有经纬度的键
+COORDINATE_KEYS = frozenset({"latitude", "longitude"})
+
+# 查询无结果的缓存有效期（秒），过期后重新查询
+NEGATIVE_CACHE_TTL = 7 * 24 * 3600
+
+# 缓存数据库连接和预加载到内存中的缓存条目 {key: (纬度, 经度, 时间戳)}
+_cache_db: Optional[sqlite3.Connection] = None
+_cache_entries: Dict[str, Tuple[Optional[float], Optional[float], int]] = {}
+
+
 class APIFailureException(Exception):
     """
     API故障异常，用于标识API调用过程中的严重错误（如超时、连接问题等）
@@ -31,185 +62,419 @@ def load_city_list(file_path: str) -> Dict[str, Any]:
         包含城市信息的字典
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return json.loads(Path(file_path).read_bytes())
     except Exception as e:
         print(f"加载城市列表失败: {e}")
         return {}
 
 
-def save_city_list(file_path: str, city_data: Dict[str, Any]) -> None:
+def save_city_list(file_path: str, city_data: Dict[str, Any]) -> bool:
     """
     保存更新后的城市列表数据
     
     Args:
         file_path: 保存文件路径
         city_data: 包含城市信息的字典
+        
+    Returns:
+        是否保存成功
     """
+    # 一次性序列化后整体写入临时文件再原子替换，避免逐块写入和写到一半中断时损坏城市列表
+    tmp_path = f"{file_path}.tmp"
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(city_data, f, ensure_ascii=False, indent=2)
+        Path(tmp_path).write_bytes(json.dumps(city_data, ensure_ascii=False, indent=2).encode('utf-8'))
+        os.replace(tmp_path, file_path)
         print(f"城市列表已保存到 {file_path}")
+        return True
     except Exception as e:
         print(f"保存城市列表失败: {e}")
+        return False
+
+
+def replay_geocode_journal(city_data: Dict[str, Any], journal_path: Path = GEOCODE_JOURNAL_PATH) -> int:
+    """
+    将上次运行中断前写入增量日志的经纬度合并到城市列表
+    
+    Args:
+        city_data: 包含城市信息的字典
+        journal_path: 增量日志文件路径
+        
+    Returns:
+        合并的城市数
+    """
+    if not journal_path.exists():
+        return 0
+    
+    city_dict = city_data.get("city", {})
+    replayed = 0
+    with open(journal_path, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 中断时最后一行可能写入不完整，跳过即可
+                continue
+            city_info = city_dict.get(record["p"], {}).get(record["c"])
+            if city_info is not None:
+                city_info["latitude"] = record["lat"]
+                city_info["longitude"] = record["lon"]
+                replayed += 1
+    return replayed
+
+
+def cache_key(city_name: str, province_name: str = "") -> str:
+    """
+    生成地理编码缓存的键，忽略首尾空白和大小写
+    
+    Args:
+        city_name: 城市名称
+        province_name: 省份名称
+        
+    Returns:
+        缓存键
+    """
+    return f"{city_name.strip().lower()}|{province_name.strip().lower()}|cn"
+
+
+def open_geocode_cache(cache_path: Path = GEOCODE_CACHE_PATH) -> sqlite3.Connection:
+    """
+    打开地理编码缓存数据库，并将全部缓存条目预加载到内存
+    
+    Args:
+        cache_path: 缓存数据库文件路径
+        
+    Returns:
+        数据库连接
+    """
+    global _cache_db
+    if _cache_db is None:
+        conn = sqlite3.connect(str(cache_path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode_cache ("
+            "key TEXT PRIMARY KEY, lat REAL, lon REAL, ts INTEGER)"
+        )
+        conn.commit()
+        _cache_entries.update(
+            (key, (lat, lon, ts)) for key, lat, lon, ts in conn.execute("SELECT key, lat, lon, ts FROM geocode_cache")
+        )
+        _cache_db = conn
+    return _cache_db
+
+
+def _cache_get(key: str) -> Optional[tuple]:
+    """
+    查询地理编码缓存
+    
+    Args:
+        key: 缓存键
+        
+    Returns:
+        (纬度, 经度) 的元组，查询无结果的缓存也返回(None, None)；未命中或已过期时返回None
+    """
+    open_geocode_cache()
+    entry = _cache_entries.get(key)
+    if entry is None:
+        return None
+    lat, lon, ts = entry
+    if lat is None and time.time() - ts > NEGATIVE_CACHE_TTL:
+        return None
+    return (lat, lon)
+
+
+def _cache_put(key: str, lat: Optional[float], lon: Optional[float]) -> None:
+    """
+    写入地理编码缓存
+    
+    Args:
+        key: 缓存键
+        lat: 纬度，查询无结果时为None
+        lon: 经度，查询无结果时为None
+    """
+    conn = open_geocode_cache()
+    ts = int(time.time())
+    _cache_entries[key] = (lat, lon, ts)
+    try:
+        conn.execute("INSERT OR REPLACE INTO geocode_cache (key, lat, lon, ts) VALUES (?, ?, ?, ?)", (key, lat, lon, ts))
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"写入地理编码缓存失败: {e}")
+
+
+@lru_cache(maxsize=1)
+def get_geolocator() -> Nominatim:
+    """
+    获取共享的Nominatim地理编码器，所有请求复用同一个HTTP会话
+    
+    Returns:
+        Nominatim地理编码器
+    """
+    return Nominatim(user_agent="weather_data_collector")
+
+
+@lru_cache(maxsize=1)
+def get_geocode() -> AsyncRateLimiter:
+    """
+    获取共享的限速异步地理编码函数，同一进程内的所有批次共用一个限速器
+    
+    Returns:
+        限速包装后的异步地理编码函数
+    """
+    geolocator = get_geolocator()
+    # geopy 的同步地理编码器在专用线程池中执行，避免阻塞事件循环；
+    # 线程数与并发上限一致，不受事件循环默认线程池大小的限制
+    executor = ThreadPoolExecutor(max_workers=GEOCODE_CONCURRENCY, thread_name_prefix="geocode")
+    return AsyncRateLimiter(
+        lambda query: asyncio.get_running_loop().run_in_executor(executor, geolocator.geocode, query),
+        min_delay_seconds=GEOCODE_MIN_DELAY,
+        max_retries=2,
+        error_wait_seconds=5.0,
+        swallow_exceptions=False
+    )
+
+
+def build_query(city_name: str, province_name: str = "") -> str:
+    """
+    构建地理编码查询字符串，添加中国作为国家以提高精度
+    
+    Args:
+        city_name: 城市名称
+        province_name: 省份名称
+        
+    Returns:
+        查询字符串
+    """
+    if not province_name or city_name == province_name:
+        return f"{city_name}, China"
+    return f"{city_name}, {province_name}, China"
 
 
-def get_lat_lon(city_name: str, province_name: str = "") -> tuple:
+async def get_lat_lon(city_name: str, province_name: str = "",
+                      geocode: Optional[Callable[[str], Awaitable[Any]]] = None) -> tuple:
     """
-    使用geopy获取城市的经纬度
+    使用geopy异步获取城市的经纬度
     
     Args:
         city_name: 城市名称
         province_name: 省份名称，用于提高查询精度
+        geocode: 经过限速包装的异步地理编码函数，默认使用共享的限速器
         
     Returns:
         (纬度, 经度) 的元组，如果查询失败则返回(None, None)
         如果发生API故障（如超时），则抛出APIFailureException异常
     """
-    geolocator = Nominatim(user_agent="weather_data_collector")
+    query = build_query(city_name, province_name)
+    
+    # 先查缓存，命中时不发出请求
+    key = cache_key(city_name, province_name)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
     
-    # 构建查询字符串，添加中国作为国家以提高精度
-    query = f"{city_name}, {province_name}, China"
-    if city_name == province_name:
-        query = f"{city_name}, China"
+    if geocode is None:
+        geocode = get_geocode()
     
     try:
-        # 添加延时以避免API限制
-        time.sleep(1)
-        location = geolocator.geocode(query)
+        location = await geocode(query)
         if location:
+            _cache_put(key, location.latitude, location.longitude)
             return (location.latitude, location.longitude)
         else:
             print(f"无法获取 {query} 的地理位置信息")
+            # 查询无结果也写入缓存，有效期内不再重复查询
+            _cache_put(key, None, None)
             return (None, None)
+    except (GeocoderTimedOut, GeocoderUnavailable, GeocoderRateLimited, GeocoderQuotaExceeded) as e:
+        # API故障（超时、连接问题、限流等），中断本次处理
+        print(f"获取 {query} 的地理位置信息时出错: {e}")
+        print(f"检测到API故障: {e}")
+        raise APIFailureException(f"API故障: {e}")
     except Exception as e:
-        error_msg = str(e)
         print(f"获取 {query} 的地理位置信息时出错: {e}")
-        
-        # 检测API故障（超时、连接问题等）
-        if "Max retries exceeded" in error_msg or "Read timed out" in error_msg or "ReadTimeoutError" in error_msg:
-            print(f"检测到API故障: {error_msg}")
-            raise APIFailureException(f"API故障: {error_msg}")
-            
         return (None, None)
 
 
-def update_city_list_with_coordinates(city_data: Dict[str, Any], max_requests: int = 100) -> Dict[str, Any]:
+async def geocode_cities(tasks: List[Tuple[str, str]], journal: Optional[BinaryIO] = None) -> List[Optional[Any]]:
+    """
+    并发获取一批城市的经纬度
+    
+    所有请求共用一个限速器，保证请求间隔不小于 GEOCODE_MIN_DELAY 秒；
+    任一请求发生API故障后，尚未发出的请求不再发出
+    
+    Args:
+        tasks: (省份, 城市) 元组列表
+        journal: 增量日志文件，每获取到一个城市的经纬度立即追加一行
+        
+    Returns:
+        与tasks顺序一致的结果列表，元素为 (纬度, 经度) 元组、APIFailureException，
+        或因API故障而未发出请求时的None
+    """
+    geocode = get_geocode()
+    semaphore = asyncio.Semaphore(GEOCODE_CONCURRENCY)
+    api_failed = asyncio.Event()
+    
+    async def bounded(province: str, city: str) -> Optional[tuple]:
+        async with semaphore:
+            if api_failed.is_set():
+                return None
+            try:
+                result = await get_lat_lon(city, province, geocode)
+            except APIFailureException:
+                api_failed.set()
+                raise
+            if journal is not None and result[0] is not None:
+                record = {"p": province, "c": city, "lat": result[0], "lon": result[1]}
+                journal.write((json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8'))
+                journal.flush()
+            return result
+    
+    return await asyncio.gather(*(bounded(province, city) for province, city in tasks), return_exceptions=True)
+
+
+def update_city_list_with_coordinates(city_data: Dict[str, Any], max_requests: int = 100,
+                                      journal_path: Optional[Path] = None) -> Dict[str, Any]:
     """
-    更新城市列表，添加经纬度信息
+    更新城市列表，添加经纬度信息，直接在传入的字典上修改
     
     Args:
         city_data: 包含城市信息的字典
         max_requests: 单次运行时的最大请求次数，用于限制API调用次数，默认为100
+        journal_path: 增量日志文件路径，指定时每获取到一个城市的经纬度就追加写入，
+            进程意外中断后可通过 replay_geocode_journal 恢复
         
     Returns:
-        更新后的城市字典
+        更新后的城市字典，即传入的city_data
     """
-    updated_data = city_data.copy()
-    city_dict = updated_data.get("city", {})
+    city_dict = city_data.get("city", {})
     
     # 获取进度信息
-    progress = updated_data.get("progress", {})
+    progress = city_data.get("progress", {})
     last_province = progress.get("last_province", "")
     last_city = progress.get("last_city", "")
-    # 每次运行时请求计数从0开始，确保max_requests是单次运行的限制
-    request_count = 0
     
     total_cities = sum(len(cities) for cities in city_dict.values())
-    processed = 0
-    resume_mode = False
     
-    # 检查是否需要恢复之前的进度
+    # 一次性展开所有缺少经纬度的城市，保持原有顺序
+    todo = list_missing_cities(city_dict)
+    offset = 0
+    
+    # 检查是否需要恢复之前的进度，直接定位到上次处理的城市
     if last_province and last_city:
-        print(f"发现上次处理进度，将从 {last_province} 省的 {last_city} 市继续...")
-        resume_mode = True
+        if (last_province, last_city) in todo:
+            print(f"发现上次处理进度，将从 {last_province} 省的 {last_city} 市继续...")
+            offset = todo.index((last_province, last_city))
+        else:
+            print(f"上次处理的 {last_province} - {last_city} 已有经纬度或不在城市列表中，将从第一个缺少经纬度的城市开始...")
+    
+    tasks = []
+    for province, city in todo[offset:]:
+        # 缓存命中的城市直接使用缓存结果，不计入API请求次数
+        cached = _cache_get(cache_key(city, province))
+        if cached is None:
+            tasks.append((province, city))
+        elif cached[0] is not None:
+            city_dict[province][city]["latitude"] = cached[0]
+            city_dict[province][city]["longitude"] = cached[1]
+            print(f"{province} - {city}: 纬度={cached[0]}, 经度={cached[1]} (缓存)")
+        else:
+            print(f"警告: 无法获取 {province} - {city} 的经纬度 (缓存)")
     
+    # 检查API请求次数限制，超出部分留到下次运行
+    next_task = None
+    if len(tasks) > max_requests:
+        next_task = tasks[max_requests]
+        tasks = tasks[:max_requests]
+    
+    print(f"共 {total_cities} 个城市，本次需要获取 {len(tasks)} 个城市的经纬度...")
     try:
-        for province, cities in city_dict.items():
-            # 如果是恢复模式且还没到上次处理的省份，则跳过
-            if resume_mode and province != last_province:
-                processed += len(cities)
-                continue
-                
-            print(f"正在处理 {province} 的城市...")
-            
-            for city in cities:
-                # 如果是恢复模式且在上次处理的省份但还没到上次处理的城市，则跳过
-                if resume_mode and province == last_province and city != last_city:
-                    processed += 1
-                    continue
-                    
-                # 一旦找到上次处理的城市，关闭恢复模式，开始正常处理
-                if resume_mode and province == last_province and city == last_city:
-                    resume_mode = False
-                
-                processed += 1
-                print(f"进度: [{processed}/{total_cities}] 正在获取 {province} - {city} 的经纬度...")
-                
-                # 检查是否已有经纬度数据
-                if "latitude" in city_dict[province][city] and "longitude" in city_dict[province][city]:
-                    print(f"{province} - {city} 已有经纬度数据，跳过")
-                    continue
-                
-                # 检查API请求次数限制
-                if request_count >= max_requests:
-                    print(f"已达到最大API请求次数限制({max_requests})，暂停处理")
-                    # 保存当前进度
-                    updated_data["progress"] = {
-                        "last_province": province,
-                        "last_city": city,
-                        "request_count": request_count
-                    }
-                    return updated_data
-                
-                try:
-                    # 获取经纬度
-                    lat, lon = get_lat_lon(city, province)
-                    request_count += 1
-                    
-                    # 更新进度信息
-                    updated_data["progress"] = {
-                        "last_province": province,
-                        "last_city": city,
-                        "request_count": request_count
-                    }
-                    
-                    if lat is not None and lon is not None:
-                        city_dict[province][city]["latitude"] = lat
-                        city_dict[province][city]["longitude"] = lon
-                        print(f"{province} - {city}: 纬度={lat}, 经度={lon}")
-                    else:
-                        print(f"警告: 无法获取 {province} - {city} 的经纬度")
-                        
-                except APIFailureException as e:
-                    print(f"API故障，中断处理: {e}")
-                    # 保存当前进度，记录失败位置
-                    updated_data["progress"] = {
-                        "last_province": province,
-                        "last_city": city,
-                        "request_count": request_count,
-                        "api_failure": True,
-                        "failure_reason": str(e)
-                    }
-                    print(f"已保存当前进度，下次运行时将从 {province} - {city} 继续")
-                    return updated_data
-                    
+        if journal_path is not None:
+            with open(journal_path, 'ab') as journal:
+                results = asyncio.run(geocode_cities(tasks, journal))
+        else:
+            results = asyncio.run(geocode_cities(tasks))
     except Exception as e:
         print(f"处理过程中发生错误: {e}")
-        # 保存当前进度
-        updated_data["progress"] = {
+        # 保存当前进度，下次从本批第一个城市重新开始
+        if tasks:
+            city_data["progress"] = {
+                "last_province": tasks[0][0],
+                "last_city": tasks[0][1],
+                "request_count": 0
+            }
+        return city_data
+    
+    request_count = 0
+    failure = None
+    for (province, city), result in zip(tasks, results):
+        if result is None:
+            # 因API故障未发出请求
+            continue
+        request_count += 1
+        if isinstance(result, APIFailureException):
+            # 记录最早出现故障的城市，下次从这里继续
+            if failure is None:
+                failure = (province, city, result)
+            continue
+        if isinstance(result, Exception):
+            print(f"获取 {province} - {city} 的经纬度时出错: {result}")
+            continue
+        
+        lat, lon = result
+        if lat is not None and lon is not None:
+            city_dict[province][city]["latitude"] = lat
+            city_dict[province][city]["longitude"] = lon
+            print(f"{province} - {city}: 纬度={lat}, 经度={lon}")
+        else:
+            print(f"警告: 无法获取 {province} - {city} 的经纬度")
+    
+    if failure is not None:
+        province, city, e = failure
+        print(f"API故障，中断处理: {e}")
+        # 保存当前进度，记录失败位置
+        city_data["progress"] = {
             "last_province": province,
             "last_city": city,
+            "request_count": request_count,
+            "api_failure": True,
+            "failure_reason": str(e)
+        }
+        print(f"已保存当前进度，下次运行时将从 {province} - {city} 继续")
+        return city_data
+    
+    if next_task is not None:
+        print(f"已达到最大API请求次数限制({max_requests})，暂停处理")
+        # 保存当前进度
+        city_data["progress"] = {
+            "last_province": next_task[0],
+            "last_city": next_task[1],
             "request_count": request_count
         }
-        return updated_data
+        return city_data
     
     # 处理完成后，清除进度信息
-    if "progress" in updated_data:
-        del updated_data["progress"]
+    if "progress" in city_data:
+        del city_data["progress"]
         print("所有城市处理完成，已清除进度信息")
     
-    return updated_data
+    return city_data
+
+
+def list_missing_cities(city_dict: Dict[str, Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """
+    按原有顺序列出缺少经纬度信息的城市
+    
+    Args:
+        city_dict: 城市字典，格式为 {省份: {城市名: 城市信息}}
+        
+    Returns:
+        (省份, 城市) 元组列表
+    """
+    return [
+        (province, city)
+        for province, cities in city_dict.items()
+        for city, city_info in cities.items()
+        if not city_info.keys() >= COORDINATE_KEYS
+    ]
 
 
 def check_missing_coordinates(city_data: Dict[str, Any]) -> Dict[str, Dict[str, str]]:
@@ -222,18 +487,11 @@ def check_missing_coordinates(city_data: Dict[str, Any]) -> Dict[str, Dict[str,
     Returns:
         包含缺少经纬度信息的城市的字典，格式为 {省份: {城市名: 城市信息}}
     """
-    missing_cities = {}
-    city_dict = city_data.get("city", {})
-    
-    for province, cities in city_dict.items():
-        for city, city_info in cities.items():
-            # 检查是否缺少经纬度信息
-            if "latitude" not in city_info or "longitude" not in city_info:
-                if province not in missing_cities:
-                    missing_cities[province] = {}
-                missing_cities[province][city] = city_info
-    
-    return missing_cities
+    return {
+        province: missing
+        for province, cities in city_data.get("city", {}).items()
+        if (missing := {city: city_info for city, city_info in cities.items() if not city_info.keys() >= COORDINATE_KEYS})
+    }
 
 
 def main():
@@ -244,12 +502,20 @@ def main():
     project_root = Path(__file__).parent.parent
     city_list_path = project_root / "city_list.json"
     
+    # 预加载地理编码缓存
+    open_geocode_cache()
+    
     print(f"正在从 {city_list_path} 加载城市列表...")
     city_data = load_city_list(str(city_list_path))
     if not city_data:
         print("城市列表为空或加载失败，退出程序")
         return
     
+    # 合并上次运行意外中断前已获取但未保存的经纬度
+    replayed = replay_geocode_journal(city_data)
+    if replayed:
+        print(f"从增量日志恢复了 {replayed} 个城市的经纬度")
+    
     # 设置最大API请求次数，可以通过命令行参数传入
     import argparse
     parser = argparse.ArgumentParser(description="获取城市经纬度信息")
@@ -261,7 +527,7 @@ def main():
     if "progress" in city_data:
         print(f"发现未完成的处理进度，将从断点继续...")
         print(f"开始获取城市经纬度信息，最大API请求次数限制为 {args.max_requests}...")
-        updated_city_data = update_city_list_with_coordinates(city_data, args.max_requests)
+        updated_city_data = update_city_list_with_coordinates(city_data, args.max_requests, GEOCODE_JOURNAL_PATH)
     else:
         # 检查是否有缺少经纬度信息的城市
         missing_cities = check_missing_coordinates(city_data)
@@ -279,7 +545,7 @@ def main():
                 
                 # 更新缺少经纬度信息的城市
                 print(f"开始获取缺失城市经纬度信息，最大API请求次数限制为 {args.max_requests}...")
-                updated_missing_data = update_city_list_with_coordinates(missing_data, args.max_requests)
+                updated_missing_data = update_city_list_with_coordinates(missing_data, args.max_requests, GEOCODE_JOURNAL_PATH)
                 
                 # 将更新后的城市信息合并回原始数据
                 for province, cities in updated_missing_data.get("city", {}).items():
@@ -331,7 +597,9 @@ def main():
             print("所有城市经纬度信息获取完成！")
     
     print("正在保存更新后的城市列表...")
-    save_city_list(str(city_list_path), updated_city_data)
+    if save_city_list(str(city_list_path), updated_city_data):
+        # 增量日志中的经纬度已全部写入城市列表
+        GEOCODE_JOURNAL_PATH.unlink(missing_ok=True)
     
     if "progress" in updated_city_data:
         print("处理未完成，下次运行时将从断点继续")
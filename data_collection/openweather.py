@@ -1,11 +1,23 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import asyncio
+import calendar
+import json
 import logging
 import requests
+import threading
 import time
-from datetime import datetime, timezone
-from typing import Dict, Any, List, Tuple, Optional, Union
+from collections import deque, defaultdict
+from itertools import chain
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.util.request import ACCEPT_ENCODING
+from typing import Dict, Any, List, Tuple, Optional, Union, Iterable, Iterator
+
+from .http_cache import conditional_get
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -13,12 +25,78 @@ logger = logging.getLogger(__name__)
 # --- Constants ---
 API_ENDPOINT = "https://history.openweathermap.org/data/2.5/history/city"
 MAX_RETRIES = 3
-RETRY_DELAY_SECONDS = 5
+RETRY_BACKOFF_FACTOR = 1.0
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+POOL_SIZE = 16
+MONTH_WORKERS = 6
+# Concurrent monthly requests across all cities on the async path; matches the
+# connection pool size so every in-flight request can hold a pooled connection
+ASYNC_CONCURRENCY = POOL_SIZE
+CALLS_PER_MINUTE = 60
+
+# Shared session so that all monthly requests reuse pooled keep-alive connections.
+# Retries (including 429 with Retry-After) are handled by urllib3; after the last
+# retry the final response is returned so raise_for_status() reports its status.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=POOL_SIZE,
+    pool_maxsize=POOL_SIZE,
+    max_retries=Retry(
+        total=MAX_RETRIES,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+))
+# Hourly history responses are large JSON documents; always negotiate compression.
+# ACCEPT_ENCODING lists gzip/deflate plus br/zstd when their decoders are installed,
+# and urllib3 decompresses transparently before response.content is read.
+_SESSION.headers['Accept-Encoding'] = ACCEPT_ENCODING
 
 class APIRequestException(Exception):
     """Custom exception for API request errors."""
     pass
 
+class RateLimiter:
+    """
+    Sliding-window rate limiter shared by all threads: at most `max_calls`
+    calls are allowed to start within any `period` seconds.
+    """
+    def __init__(self, max_calls: int, period: float):
+        self.max_calls = max_calls
+        self.period = period
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until another call may start, then record it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.max_calls:
+                    self._calls.append(now)
+                    return
+                wait = self.period - (now - self._calls[0])
+            time.sleep(wait)
+
+# Shared by every monthly request so concurrent fetches stay within the API quota
+_RATE_LIMITER = RateLimiter(CALLS_PER_MINUTE, 60.0)
+
+@lru_cache(maxsize=None)
+def month_bounds(year: int, month: int) -> Tuple[int, int]:
+    """
+    Returns the first and last second of a month as UTC Unix timestamps.
+    
+    Computed once per (year, month) and shared by every city and thread;
+    calendar.timegm does not depend on the local timezone.
+    """
+    start_timestamp = calendar.timegm((year, month, 1, 0, 0, 0))
+    end_timestamp = calendar.timegm((year + (month == 12), month % 12 + 1, 1, 0, 0, 0)) - 1 # End of the last day of the month
+    return start_timestamp, end_timestamp
+
 def get_weather_data_for_month(lat: float, lon: float, year: int, month: int, api_key: str) -> Dict[str, Any]:
     """
     Fetches historical weather data for a specific month from the OpenWeather API.
@@ -34,17 +112,10 @@ def get_weather_data_for_month(lat: float, lon: float, year: int, month: int, ap
         A dictionary containing the API response data.
         
     Raises:
-        APIRequestException: If the API request fails after multiple retries.
-    """
-    # Calculate start and end timestamps for the month
-    start_dt = datetime(year, month, 1, tzinfo=timezone.utc)
-    if month == 12:
-        end_dt = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
-    else:
-        end_dt = datetime(year, month + 1, 1, tzinfo=timezone.utc)
-        
-    start_timestamp = int(start_dt.timestamp())
-    end_timestamp = int(end_dt.timestamp()) - 1 # End of the last day of the month
+        APIRequestException: If the API request fails after the session's retries are exhausted.
+    """
+    # Start and end UTC timestamps for the month
+    start_timestamp, end_timestamp = month_bounds(year, month)
 
     params = {
         'lat': lat,
@@ -56,106 +127,111 @@ def get_weather_data_for_month(lat: float, lon: float, year: int, month: int, ap
         'units': 'metric'  # Request temperature in Celsius
     }
 
-    for attempt in range(MAX_RETRIES):
-        try:
-            response = requests.get(API_ENDPOINT, params=params, timeout=20)
-            response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
-            logger.info(f"Successfully fetched data for {year}-{month:02d} for location ({lat}, {lon})")
-            return response.json()
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 429:
-                logger.warning(f"Rate limit exceeded. Retrying in {RETRY_DELAY_SECONDS}s... (Attempt {attempt + 1}/{MAX_RETRIES})")
-                time.sleep(RETRY_DELAY_SECONDS)
-            else:
-                raise APIRequestException(f"HTTP Error: {e.response.status_code} {e.response.text}")
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"Request failed: {e}. Retrying in {RETRY_DELAY_SECONDS}s... (Attempt {attempt + 1}/{MAX_RETRIES})")
-            time.sleep(RETRY_DELAY_SECONDS)
-
-    raise APIRequestException(f"API request failed for {year}-{month:02d} after {MAX_RETRIES} retries.")
+    _RATE_LIMITER.acquire()
+    try:
+        # Conditional request: a 304 reuses the cached body instead of downloading it again
+        response = conditional_get(_SESSION, API_ENDPOINT, params=params, timeout=20)
+        response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
+        logger.info("Successfully fetched data for %s-%02d for location (%s, %s)", year, month, lat, lon)
+        # Parse the raw bytes directly; json detects the UTF encoding itself
+        return json.loads(response.content)
+    except requests.exceptions.HTTPError as e:
+        raise APIRequestException(f"HTTP Error: {e.response.status_code} {e.response.text}")
+    except requests.exceptions.RequestException as e:
+        raise APIRequestException(f"API request failed for {year}-{month:02d} after {MAX_RETRIES} retries: {e}")
+    except ValueError as e:
+        raise APIRequestException(f"Invalid JSON response for {year}-{month:02d}: {e}")
 
 def get_weather_data(city: str, lat: float, lon: float, year: int, api_key: str) -> Optional[Dict[str, Any]]:
     """
-    Fetches and combines historical weather data for an entire year by iterating through months.
+    Fetches and combines historical weather data for an entire year.
+    
+    The 12 monthly requests run concurrently; the shared rate limiter keeps them
+    within the API quota. The returned 'list' is a single-pass iterator over the
+    hourly entries of all months in calendar order.
     """
-    full_year_data = {'list': []}
-    logger.info(f"Starting to fetch yearly data for {city} ({year})...")
+    logger.info("Starting to fetch yearly data for %s (%s)...", city, year)
+    
+    monthly_results = {}
+    executor = ThreadPoolExecutor(max_workers=MONTH_WORKERS)
+    try:
+        futures = {
+            executor.submit(get_weather_data_for_month, lat, lon, year, month, api_key): month
+            for month in range(1, 13)
+        }
+        for future in as_completed(futures):
+            month = futures[future]
+            try:
+                monthly_results[month] = future.result()
+            except APIRequestException as e:
+                logger.error("Failed to fetch data for %s-%02d. Aborting for this year. Reason: %s", year, month, e)
+                return None # If one month fails, we cannot calculate accurate yearly averages
+    finally:
+        # Months that have not started yet are dropped once any month has failed
+        executor.shutdown(wait=True, cancel_futures=True)
     
-    for month in range(1, 13):
-        try:
-            monthly_data = get_weather_data_for_month(lat, lon, year, month, api_key)
-            if 'list' in monthly_data:
-                full_year_data['list'].extend(monthly_data['list'])
-            # A small delay to be respectful to the API
-            time.sleep(1)
-        except APIRequestException as e:
-            logger.error(f"Failed to fetch data for {year}-{month:02d}. Aborting for this year. Reason: {e}")
-            return None # If one month fails, we cannot calculate accurate yearly averages
-            
-    return full_year_data
+    # Combine in calendar order regardless of completion order
+    return {'list': _chain_months(monthly_results[month] for month in range(1, 13))}
+
+def _chain_months(monthly_results: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Streams the hourly entries of consecutive monthly responses without
+    concatenating them into one yearly list.
+    """
+    return chain.from_iterable(monthly_data.get('list', ()) for monthly_data in monthly_results)
 
 def process_weather_data(data: Dict[str, Any]) -> Tuple[Optional[float], Optional[float]]:
     """
     Processes the raw hourly data for a year to calculate annual averages.
     
     Args:
-        data: A dictionary containing the raw 'list' of hourly data points.
+        data: A dictionary whose 'list' is an iterable of raw hourly data points;
+            it is consumed in a single pass.
         
     Returns:
         A tuple containing:
         - Average daily temperature for the year.
         - Average daily precipitation for the year.
     """
-    if not data or 'list' not in data or not data['list']:
+    if not data or 'list' not in data or data['list'] == []:
         logger.warning("No data provided to process.")
         return None, None
 
-    daily_data = {} # Key: 'YYYY-MM-DD', Value: {'temps': [], 'precip': 0.0}
+    # Bucket entries by UTC day number (dt // 86400) instead of formatting a
+    # date string per entry; per-day temperature sums/counts and precipitation
+    # totals are accumulated directly rather than collected into lists.
+    day_temp_sum = defaultdict(float)   # Key: day number, Value: sum of hourly temperatures
+    day_temp_count = defaultdict(int)   # Key: day number, Value: number of hourly temperatures
+    day_precip = defaultdict(float)     # Key: day number, Value: total precipitation (mm)
 
     for entry in data['list']:
-        dt_object = datetime.fromtimestamp(entry['dt'], tz=timezone.utc)
-        day_key = dt_object.strftime('%Y-%m-%d')
+        day = entry['dt'] // 86400
 
-        if day_key not in daily_data:
-            daily_data[day_key] = {'temps': [], 'precip': 0.0}
-        
         # Aggregate temperature
-        if 'main' in entry and 'temp' in entry['main']:
-            daily_data[day_key]['temps'].append(entry['main']['temp'])
-        
-        # Aggregate precipitation (rain + snow)
-        precip_mm = 0.0
-        if 'rain' in entry and '1h' in entry['rain']:
-            precip_mm += entry['rain']['1h']
-        if 'snow' in entry and '1h' in entry['snow']:
-            precip_mm += entry['snow']['1h']
-        daily_data[day_key]['precip'] += precip_mm
-
-    if not daily_data:
-        logger.warning("Could not aggregate any daily data.")
-        return None, None
+        if (main := entry.get('main')) and (temp := main.get('temp')) is not None:
+            day_temp_sum[day] += temp
+            day_temp_count[day] += 1
 
-    # Calculate daily averages and totals
-    yearly_avg_temps = []
-    yearly_total_precip = 0.0
+        # Aggregate precipitation (rain + snow), one lookup per field
+        rain = entry.get('rain')
+        snow = entry.get('snow')
+        precip_mm = (rain.get('1h', 0.0) if rain else 0.0) + (snow.get('1h', 0.0) if snow else 0.0)
+        day_precip[day] += precip_mm
 
-    for day_key, values in daily_data.items():
-        if values['temps']:
-            avg_temp_day = sum(values['temps']) / len(values['temps'])
-            yearly_avg_temps.append(avg_temp_day)
-        
-        yearly_total_precip += values['precip']
+    if not day_precip:
+        logger.warning("Could not aggregate any daily data.")
+        return None, None
 
-    if not yearly_avg_temps:
+    if not day_temp_count:
         logger.warning("No valid temperature data to calculate annual average.")
         return None, None
 
-    # Calculate final annual averages
-    avg_temp_year = sum(yearly_avg_temps) / len(yearly_avg_temps)
+    # Calculate final annual averages from the daily averages
+    avg_temp_year = sum(day_temp_sum[day] / count for day, count in day_temp_count.items()) / len(day_temp_count)
     # Average daily precipitation over the number of days for which we have data
-    avg_precip_day_year = yearly_total_precip / len(daily_data)
+    avg_precip_day_year = sum(day_precip.values()) / len(day_precip)
 
-    logger.info(f"Data processed: Avg Temp={avg_temp_year:.2f}°C, Avg Daily Precip={avg_precip_day_year:.2f}mm")
+    logger.info("Data processed: Avg Temp=%.2f°C, Avg Daily Precip=%.2fmm", avg_temp_year, avg_precip_day_year)
     
     return avg_temp_year, avg_precip_day_year
 
@@ -165,7 +241,7 @@ def get_city_weather(province: str, city: str, year: int, api_key: str, lat: flo
     
     This function is called by the central dispatcher.
     """
-    logger.info(f"Using OpenWeather module for {province} - {city} ({year})")
+    logger.info("Using OpenWeather module for %s - %s (%s)", province, city, year)
     
     raw_data = get_weather_data(city, lat, lon, year, api_key)
     if not raw_data:
@@ -177,4 +253,75 @@ def get_city_weather(province: str, city: str, year: int, api_key: str, lat: flo
         # The result format [city, year, avg_temp, avg_value] must be consistent
         return [city, year, avg_temp, avg_precip]
     
-    return None
\ No newline at end of file
+    return None
+
+async def _fetch_month(semaphore: asyncio.Semaphore, executor: Optional[ThreadPoolExecutor],
+                       lat: float, lon: float, year: int, month: int, api_key: str) -> Dict[str, Any]:
+    """
+    Fetches one month on a worker thread, bounded by the shared semaphore.
+    
+    The blocking request still goes through the pooled session and the shared
+    rate limiter, so the async path obeys the same quota as the sync one.
+    """
+    async with semaphore:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, get_weather_data_for_month, lat, lon, year, month, api_key)
+
+async def get_city_weather_async(province: str, city: str, year: int, api_key: str, lat: float, lon: float,
+                                 semaphore: Optional[asyncio.Semaphore] = None,
+                                 executor: Optional[ThreadPoolExecutor] = None) -> Optional[List[Union[str, int, float]]]:
+    """
+    Async counterpart of get_city_weather: all 12 months are awaited together.
+    
+    Args:
+        semaphore: Limits concurrent monthly requests; pass the same semaphore for
+            every city so the limit applies across all of them.
+        executor: Thread pool that runs the blocking requests; defaults to the
+            event loop's default executor.
+    """
+    logger.info("Using OpenWeather module (async) for %s - %s (%s)", province, city, year)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(ASYNC_CONCURRENCY)
+    
+    month_tasks = [
+        asyncio.ensure_future(_fetch_month(semaphore, executor, lat, lon, year, month, api_key))
+        for month in range(1, 13)
+    ]
+    try:
+        monthly_results = await asyncio.gather(*month_tasks)
+    except APIRequestException as e:
+        # Like the sync path, drop the months that have not finished yet once any month has failed,
+        # so they stop holding semaphore slots and rate-limiter quota
+        for task in month_tasks:
+            task.cancel()
+        await asyncio.gather(*month_tasks, return_exceptions=True)
+        logger.error("Failed to fetch data for %s (%s). Aborting for this year. Reason: %s", city, year, e)
+        return None # If one month fails, we cannot calculate accurate yearly averages
+    
+    avg_temp, avg_precip = process_weather_data({'list': _chain_months(monthly_results)})
+    
+    if avg_temp is not None and avg_precip is not None:
+        return [city, year, avg_temp, avg_precip]
+    
+    return None
+
+async def get_cities_weather_async(tasks: List[Tuple[str, str, int, float, float]], api_key: str,
+                                   concurrency: int = ASYNC_CONCURRENCY) -> List[Optional[List[Union[str, int, float]]]]:
+    """
+    Fetches many cities concurrently, overlapping the monthly requests of all of them.
+    
+    Args:
+        tasks: (province, city, year, lat, lon) tuples.
+        api_key: Your OpenWeather API key.
+        concurrency: Maximum number of monthly requests in flight at once.
+        
+    Returns:
+        Results in the same order as tasks, None for cities that failed.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    # A dedicated pool so that the thread count, not the default executor size, matches the concurrency
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return await asyncio.gather(*(
+            get_city_weather_async(province, city, year, api_key, lat, lon, semaphore, executor)
+            for province, city, year, lat, lon in tasks
+        ))
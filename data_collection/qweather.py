@@ -1,23 +1,87 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import atexit
+import calendar
+import json
 import logging
+import math
+import os
 import requests
+import sqlite3
+import threading
 import time
-from datetime import datetime, timedelta
-from typing import Dict, Any, List, Tuple, Optional, Union
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Any, List, Tuple, Optional, Union, Iterable
+
+from .http_utils import parse_retry_after
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+
+def _env_positive_int(name: str, default: Optional[int]) -> Optional[int]:
+    """
+    读取正整数类型的环境变量；未设置、格式错误或不是正数时记录警告并使用默认值，
+    避免错误的配置在导入模块时就让整个采集程序崩溃
+    """
+    raw = os.environ.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        logger.warning("环境变量 %s=%r 不是整数，忽略该设置", name, raw)
+        return default
+    if value <= 0:
+        logger.warning("环境变量 %s=%r 必须为正数，忽略该设置", name, raw)
+        return default
+    return value
+
 # --- Constants ---
 # 注意：这些是基于和风天气API风格的假设值，您需要根据您的实际API文档进行修改。
 LOCATION_SEARCH_ENDPOINT = "https://geoapi.qweather.com/v2/city/lookup"
 # 假设的历史天气API端点
 HISTORICAL_WEATHER_ENDPOINT = "https://api.qweather.com/v7/historical/weather" 
+# 按日期范围查询历史天气的端点（参数 start/end，格式 YYYYMMDD，返回区间内每天的 weatherDaily 列表）。
+# 如果您的API提供此类端点，请填写后启用：每年只需12次按月请求，查询失败的月份再退回逐日请求
+HISTORICAL_RANGE_ENDPOINT: Optional[str] = None
 
 MAX_RETRIES = 3
 RETRY_DELAY_SECONDS = 2
+REQUESTS_PER_SECOND = _env_positive_int('QWEATHER_REQUESTS_PER_SECOND', 10)
+# 单次请求的预期往返时间（秒）。要用满配额，同时在途的请求数约为 速率 × 往返时间，
+# 再多的线程只会在限速器上等待；可用环境变量 QWEATHER_DAY_WORKERS 直接指定
+EXPECTED_RTT_SECONDS = 1.5
+DAY_WORKERS = _env_positive_int('QWEATHER_DAY_WORKERS', None) or math.ceil(REQUESTS_PER_SECOND * EXPECTED_RTT_SECONDS) + 1
+POOL_CONNECTIONS = 16
+# 连接池至少能容纳一个城市的全部并发请求，避免 "Connection pool is full" 时丢弃连接
+POOL_MAXSIZE = max(32, DAY_WORKERS)
+# 自适应限速：被限流(429)时速率减半，之后每次成功回升2%，直到恢复 REQUESTS_PER_SECOND
+MIN_REQUESTS_PER_SECOND = 0.5
+RATE_INCREASE_FACTOR = 1.02
+RATE_DECREASE_FACTOR = 0.5
+# 持续被限流超过此秒数（期间没有任何成功请求）视为配额耗尽，放弃这一年的其余请求
+QUOTA_EXHAUSTED_SECONDS = 30.0
+# 请求参数或密钥有误（400/401/403），重试也不会成功，直接放弃整个城市-年份
+PERMANENT_ERROR_CODES = frozenset({'400', '401', '403'})
+# 城市到 Location ID 的持久化缓存，跨运行复用，避免每个城市-年份都重新查询
+LOCATION_CACHE_PATH = Path(__file__).parent / 'cache' / 'qweather_locations.json'
+# 按 (Location ID, 日期) 缓存每天的历史数据，中途失败后重新运行时已获取的日期不再请求
+DAY_CACHE_PATH = Path(__file__).parent / 'cache' / 'qweather_days.sqlite'
+
+# 模块级共享会话，所有请求复用保持连接的TCP/TLS连接，省去每次请求的握手开销；
+# 连接池由urllib3加锁管理，可在多个线程间共享。重试由下方的请求函数自行处理
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+# 显式声明接受压缩的响应体：gzip/deflate，以及已安装解码器时的 br/zstd，由urllib3透明解压
+_SESSION.headers['Accept-Encoding'] = ACCEPT_ENCODING
 
 class APIKeyError(Exception):
     """Custom exception for missing API key."""
@@ -27,34 +91,212 @@ class APIRequestException(Exception):
     """Custom exception for API request errors."""
     pass
 
+class RateLimiter:
+    """
+    令牌桶限速器，所有线程共享：令牌以 rate 个/秒的速度补充，最多积攒 burst 个。
+    有余量时请求立即放行，只有超过速率时才等待，长期平均速率不超过 rate 次/秒。
+    
+    速率按加性增、乘性减(AIMD)自适应：on_throttled 在服务器限流时降低速率，
+    on_success 在请求成功后逐步回升，但不会超过初始的 rate。
+    从第一次限流起一直没有成功请求时，quota_exhausted 在 QUOTA_EXHAUSTED_SECONDS 秒后返回True
+    """
+    def __init__(self, rate: float, burst: Optional[int] = None, min_rate: float = MIN_REQUESTS_PER_SECOND):
+        self.rate = rate
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = float(burst if burst is not None else max(1, int(rate)))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._throttled_since: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """取走一个令牌；令牌不足时预支，并在锁外等待到令牌补足的时间点"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_success(self) -> None:
+        """请求成功，速率小幅回升"""
+        self._throttled_since = None
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate * RATE_INCREASE_FACTOR)
+
+    def on_throttled(self, retry_after: Optional[float] = None) -> None:
+        """
+        服务器返回限流响应：速率减半，已积攒的令牌清零；
+        给出 retry_after 秒时，在此之前不再放行任何请求
+        """
+        with self._lock:
+            if self._throttled_since is None:
+                self._throttled_since = time.monotonic()
+            self.rate = max(self.min_rate, self.rate * RATE_DECREASE_FACTOR)
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                # 以预支令牌的方式表示等待时间，后续请求按顺序排在其后
+                self._tokens -= retry_after * self.rate
+
+    def quota_exhausted(self) -> bool:
+        """是否已连续被限流超过 QUOTA_EXHAUSTED_SECONDS 秒"""
+        throttled_since = self._throttled_since
+        return throttled_since is not None and time.monotonic() - throttled_since >= QUOTA_EXHAUSTED_SECONDS
+
+# 所有城市、所有日期的请求共用一个限速器
+_RATE_LIMITER = RateLimiter(REQUESTS_PER_SECOND)
+
+def _load_location_cache() -> Dict[str, str]:
+    """
+    从磁盘加载 Location ID 缓存，文件不存在或损坏时返回空字典
+    """
+    try:
+        return json.loads(LOCATION_CACHE_PATH.read_bytes())
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning("加载 Location ID 缓存失败，将重新查询: %s", e)
+        return {}
+
+_LOCATION_CACHE: Dict[str, str] = _load_location_cache()
+_LOCATION_CACHE_LOCK = threading.Lock()
+# 自上次保存后是否新增了 Location ID
+_location_cache_dirty = False
+
+def save_location_cache() -> None:
+    """
+    将新增的 Location ID 写回磁盘，先写临时文件再原子替换；进程退出时自动调用
+    """
+    global _location_cache_dirty
+    with _LOCATION_CACHE_LOCK:
+        if not _location_cache_dirty:
+            return
+        payload = json.dumps(_LOCATION_CACHE, ensure_ascii=False).encode('utf-8')
+        _location_cache_dirty = False
+    try:
+        LOCATION_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = LOCATION_CACHE_PATH.with_suffix(f'.tmp.{os.getpid()}')
+        tmp_path.write_bytes(payload)
+        os.replace(tmp_path, LOCATION_CACHE_PATH)
+    except OSError as e:
+        logger.error("保存 Location ID 缓存失败: %s", e)
+
+atexit.register(save_location_cache)
+
+_day_cache_db: Optional[sqlite3.Connection] = None
+_DAY_CACHE_LOCK = threading.Lock()
+
+def _get_day_cache_db() -> sqlite3.Connection:
+    """
+    打开每日数据缓存数据库，首次调用时建表，调用方需持有 _DAY_CACHE_LOCK
+    """
+    global _day_cache_db
+    if _day_cache_db is None:
+        DAY_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(DAY_CACHE_PATH), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS days ("
+            "location_id TEXT NOT NULL, date TEXT NOT NULL, payload TEXT NOT NULL, "
+            "PRIMARY KEY (location_id, date))"
+        )
+        conn.commit()
+        _day_cache_db = conn
+    return _day_cache_db
+
+def load_cached_days(location_id: str, first_date: str, last_date: str) -> Dict[str, Dict[str, Any]]:
+    """
+    一次查询出某地点在日期区间内已缓存的每日数据
+    
+    返回:
+        Dict[str, Dict[str, Any]]: 日期(YYYYMMDD)到当天 weatherDaily 数据的映射
+    """
+    try:
+        with _DAY_CACHE_LOCK:
+            rows = _get_day_cache_db().execute(
+                "SELECT date, payload FROM days WHERE location_id = ? AND date BETWEEN ? AND ?",
+                (location_id, first_date, last_date)
+            ).fetchall()
+        return {day: json.loads(payload) for day, payload in rows}
+    except (sqlite3.Error, ValueError) as e:
+        logger.warning("读取每日数据缓存失败: %s", e)
+        return {}
+
+def save_cached_days(location_id: str, days: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+    """
+    在一个事务中写入多天的数据
+    
+    参数:
+        location_id (str): 地点ID
+        days (Iterable[Tuple[str, Dict[str, Any]]]): (日期, weatherDaily 数据) 元组
+    """
+    rows = [(location_id, day, json.dumps(payload, ensure_ascii=False)) for day, payload in days]
+    if not rows:
+        return
+    try:
+        with _DAY_CACHE_LOCK:
+            conn = _get_day_cache_db()
+            conn.executemany("INSERT OR REPLACE INTO days (location_id, date, payload) VALUES (?, ?, ?)", rows)
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.error("写入每日数据缓存失败: %s", e)
+
 def get_location_id(city: str, api_key: str) -> Optional[str]:
     """
     (模拟/假设功能) 使用和风天气的GeoAPI查询城市的Location ID。
-    在实际使用中，建议将查询到的ID缓存起来，避免重复查询。
+    查询结果缓存在 LOCATION_CACHE_PATH 中，同一城市只查询一次。
     """
+    global _location_cache_dirty
+    location_id = _LOCATION_CACHE.get(city)
+    if location_id is not None:
+        return location_id
+    
     params = {
         'location': city,
         'key': api_key,
         'number': 1 # 只���回最匹配的结果
     }
     try:
-        response = requests.get(LOCATION_SEARCH_ENDPOINT, params=params, timeout=10)
+        response = _SESSION.get(LOCATION_SEARCH_ENDPOINT, params=params, timeout=10)
         response.raise_for_status()
-        data = response.json()
+        data = json.loads(response.content)
         if data.get('code') == '200' and data.get('location'):
             location_id = data['location'][0]['id']
-            logger.info(f"成功获取城市 '{city}' 的 Location ID: {location_id}")
+            with _LOCATION_CACHE_LOCK:
+                _LOCATION_CACHE[city] = location_id
+                _location_cache_dirty = True
+            logger.info("成功获取城市 '%s' 的 Location ID: %s", city, location_id)
             return location_id
         else:
-            logger.error(f"查询 Location ID 失败: {data.get('code')}")
+            logger.error("查询 Location ID 失败: %s", data.get('code'))
             return None
     except requests.exceptions.RequestException as e:
-        logger.error(f"查询 Location ID 时发生网络错误: {e}")
+        logger.error("查询 Location ID 时发生网络错误: %s", e)
         return None
+    except ValueError as e:
+        logger.error("查询 Location ID 时返回的数据无法解析: %s", e)
+        return None
+
+def _raise_if_quota_exhausted() -> None:
+    """
+    配额耗尽时抛出 APIRequestException：异常经 future.result() 传到 get_weather_data，
+    由其取消这一年尚未开始的请求，调度器随后改用下一个API服务
+    """
+    if _RATE_LIMITER.quota_exhausted():
+        logger.error("持续被限流超过 %s 秒，判定配额已耗尽，放弃这一年的其余请求。", QUOTA_EXHAUSTED_SECONDS)
+        raise APIRequestException("Rate limit quota exhausted (429)")
 
 def get_daily_weather_data(location_id: str, date: str, api_key: str) -> Optional[Dict[str, Any]]:
     """
     (假设功能) 获取指定地点和单日的天气数据。
+    
+    网络错误、5xx 和限流会重试；参数或密钥错误等永久性错误直接抛出
+    APIRequestException，中止这一年的其余请求，而不是每一天都耗尽重试次数。
+    配额耗尽（持续限流）时同样抛出，避免其余日期继续对已耗尽的配额重试。
     """
     params = {
         'location': location_id,
@@ -64,63 +306,155 @@ def get_daily_weather_data(location_id: str, date: str, api_key: str) -> Optiona
     
     for attempt in range(MAX_RETRIES):
         try:
+            _RATE_LIMITER.acquire()
             # **重要提示**: 您需要将此处的 URL 替换为您的真实历史天气API端点
-            response = requests.get(HISTORICAL_WEATHER_ENDPOINT, params=params, timeout=15)
+            # 成功获取的日期会写入按天的缓存，之后不再请求，因此不经过HTTP条件请求缓存，避免同一天的数据存两份
+            response = _SESSION.get(HISTORICAL_WEATHER_ENDPOINT, params=params, timeout=15)
+            
+            if response.status_code == 429:
+                # 被限流时降低共享限速器的速率，并按服务器给出的 Retry-After 暂停放行；
+                # 等待由限速器负责，不再叠加固定退避
+                _RATE_LIMITER.on_throttled(parse_retry_after(response.headers.get('Retry-After')))
+                logger.warning("请求被限流(429)，降低请求速率至 %.2f 次/秒 (尝试 %s/%s)", _RATE_LIMITER.rate, attempt + 1, MAX_RETRIES)
+                _raise_if_quota_exhausted()
+                continue
             
             # 检查是否因为API不存在而返回404
             if response.status_code == 404:
                 logger.error("API端点返回 404 Not Found。请在 qweather.py 中更新为您的真实历史天气API端点。")
                 raise APIRequestException("Invalid API Endpoint")
+            
+            if str(response.status_code) in PERMANENT_ERROR_CODES:
+                logger.error("请求被拒绝: HTTP %s，请检查API密钥和请求参数。", response.status_code)
+                raise APIRequestException(f"HTTP {response.status_code}")
 
             response.raise_for_status()
-            data = response.json()
+            # 直接解析原始字节，省去先解码为字符串的一步
+            data = json.loads(response.content)
 
             # 和风天气的成功码通常是 '200'
             if data.get('code') == '200':
+                _RATE_LIMITER.on_success()
                 return data
+            elif data.get('code') == '429':
+                _RATE_LIMITER.on_throttled()
+                logger.warning("API返回限流错误码 429，降低请求速率至 %.2f 次/秒 (尝试 %s/%s)", _RATE_LIMITER.rate, attempt + 1, MAX_RETRIES)
+                _raise_if_quota_exhausted()
+                continue
+            elif data.get('code') in PERMANENT_ERROR_CODES:
+                logger.error("API返回错误码: %s，请检查API密钥和请求参数。", data.get('code'))
+                raise APIRequestException(f"API error code {data.get('code')}")
             else:
-                logger.warning(f"API返回错误码: {data.get('code')}, 重试中... (尝试 {attempt + 1}/{MAX_RETRIES})")
-                time.sleep(RETRY_DELAY_SECONDS)
+                logger.warning("API返回错误码: %s (尝试 %s/%s)", data.get('code'), attempt + 1, MAX_RETRIES)
 
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"请求失败: {e}. 重试中... (尝试 {attempt + 1}/{MAX_RETRIES})")
-            time.sleep(RETRY_DELAY_SECONDS)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning("请求失败: %s (尝试 %s/%s)", e, attempt + 1, MAX_RETRIES)
+        
+        # 只在还有下一次尝试时等待，退避时间按尝试次数翻倍；最后一次失败后直接返回
+        if attempt < MAX_RETRIES - 1:
+            time.sleep(RETRY_DELAY_SECONDS * (1 << attempt))
             
     return None
 
 
+def get_range_weather_data(location_id: str, start_date: str, end_date: str, api_key: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    (假设功能) 通过按日期范围查询的端点，一次获取一段时间内每天的天气数据。
+    
+    返回:
+        Optional[List[Dict[str, Any]]]: 按日期排列的每日数据，请求失败时返回None
+    """
+    params = {
+        'location': location_id,
+        'start': start_date, # 格式: YYYYMMDD
+        'end': end_date,
+        'key': api_key
+    }
+    
+    try:
+        _RATE_LIMITER.acquire()
+        response = _SESSION.get(HISTORICAL_RANGE_ENDPOINT, params=params, timeout=30)
+        if response.status_code == 429:
+            _RATE_LIMITER.on_throttled(parse_retry_after(response.headers.get('Retry-After')))
+        response.raise_for_status()
+        data = json.loads(response.content)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.warning("按范围查询 %s-%s 失败: %s，将改为逐日请求", start_date, end_date, e)
+        return None
+    
+    if data.get('code') != '200' or not isinstance(data.get('weatherDaily'), list):
+        logger.warning("按范围查询 %s-%s 返回错误码: %s，将改为逐日请求", start_date, end_date, data.get('code'))
+        return None
+    return data['weatherDaily']
+
+
 def get_weather_data(city: str, lat: float, lon: float, year: int, api_key: str) -> Optional[Dict[str, Any]]:
     """
-    通过迭代指定年份的每一天来获取全年的天气数据。
+    并发获取指定年份每一天的天气数据，请求速率由共享的限速器控制。
+    已缓存的日期直接使用缓存；配置了 HISTORICAL_RANGE_ENDPOINT 时先按月查询，
+    只对查询失败的月份逐日请求。新获取的日期即使全年中止也会写入缓存。
     """
     logger.warning("和风天气(QWeather)模块功能基于假设的API端点，可能需要您根据实际情况进行调整。")
     
     location_id = get_location_id(city, api_key)
     if not location_id:
-        logger.error(f"无法获取 '{city}' 的 Location ID，跳过此城市。")
+        logger.error("无法获取 '%s' 的 Location ID，跳过此城市。", city)
         return None
 
-    full_year_data = {'daily': []}
-    start_date = datetime(year, 1, 1)
-    end_date = datetime(year, 12, 31)
-    current_date = start_date
+    start_date = date(year, 1, 1)
+    days_in_year = 366 if calendar.isleap(year) else 365
+    date_strs = [(start_date + timedelta(days=i)).strftime('%Y%m%d') for i in range(days_in_year)]
 
-    while current_date <= end_date:
-        date_str = current_date.strftime('%Y%m%d')
-        logger.debug(f"正在获取 {city} {date_str} 的数据...")
-        
-        daily_data = get_daily_weather_data(location_id, date_str, api_key)
+    # 预先分配全年的槽位，每天的结果按当年第几天写入自己的位置，完成顺序不影响最终顺序
+    daily_results: List[Optional[Dict[str, Any]]] = [None] * days_in_year
+    cached_days = load_cached_days(location_id, date_strs[0], date_strs[-1])
+    for day_index, date_str in enumerate(date_strs):
+        daily_results[day_index] = cached_days.get(date_str)
+    if cached_days:
+        logger.info("%s %s年 已缓存 %s 天的数据", city, year, len(cached_days))
+    
+    # 本次新获取的 (日期, 数据)，结束时一次性写入缓存
+    new_days: List[Tuple[str, Dict[str, Any]]] = []
+    executor = ThreadPoolExecutor(max_workers=DAY_WORKERS)
+    try:
+        if HISTORICAL_RANGE_ENDPOINT:
+            # 每月一次范围查询，返回的天数与该月天数一致时整月写入对应槽位
+            month_starts = [date(year, month, 1).timetuple().tm_yday - 1 for month in range(1, 13)] + [days_in_year]
+            month_futures = {
+                executor.submit(get_range_weather_data, location_id, date_strs[first], date_strs[last - 1], api_key): (first, last)
+                for first, last in zip(month_starts, month_starts[1:])
+                if None in daily_results[first:last]
+            }
+            for future in as_completed(month_futures):
+                first, last = month_futures[future]
+                month_data = future.result()
+                if month_data is not None and len(month_data) == last - first:
+                    daily_results[first:last] = month_data
+                    new_days.extend(zip(date_strs[first:last], month_data))
         
-        if daily_data and 'weatherDaily' in daily_data:
-            full_year_data['daily'].append(daily_data['weatherDaily'])
-        else:
-            logger.error(f"获取 {city} {date_str} 的数据失败。将中止今年的数据采集以保证数据完整性。")
-            return None # 如果一天失败，则全年数据不完整
-
-        current_date += timedelta(days=1)
-        time.sleep(0.1) # 遵守API请求频率限制
+        # 逐日请求尚未获取到的日期
+        futures = {
+            executor.submit(get_daily_weather_data, location_id, date_strs[day_index], api_key): day_index
+            for day_index in range(days_in_year) if daily_results[day_index] is None
+        }
+        for future in as_completed(futures):
+            day_index = futures[future]
+            date_str = date_strs[day_index]
+            daily_data = future.result()
+            
+            if daily_data and 'weatherDaily' in daily_data:
+                daily_results[day_index] = daily_data['weatherDaily']
+                new_days.append((date_str, daily_data['weatherDaily']))
+            else:
+                logger.error("获取 %s %s 的数据失败。将中止今年的数据采集以保证数据完整性。", city, date_str)
+                return None # 如果一天失败，则全年数据不完整
+    finally:
+        # 任一天失败后，尚未开始的请求不再发出
+        executor.shutdown(wait=True, cancel_futures=True)
+        save_cached_days(location_id, new_days)
 
-    return full_year_data
+    # 任一天失败都会提前返回，此时所有槽位均已填满，且已按日期排列
+    return {'daily': daily_results}
 
 
 def process_weather_data(data: Dict[str, Any]) -> Tuple[Optional[float], Optional[float]]:
@@ -146,7 +480,7 @@ def process_weather_data(data: Dict[str, Any]) -> Tuple[Optional[float], Optiona
             total_precip += precip
             day_count += 1
         except (ValueError, KeyError) as e:
-            logger.warning(f"处理某天数据时出错，跳过该天: {e} - 数据: {daily_entry}")
+            logger.warning("处理某天数据时出错，跳过该天: %s - 数据: %s", e, daily_entry)
             continue
 
     if day_count == 0:
@@ -157,7 +491,7 @@ def process_weather_data(data: Dict[str, Any]) -> Tuple[Optional[float], Optiona
     avg_temp_year = total_avg_temp / day_count
     avg_precip_day_year = total_precip / day_count
 
-    logger.info(f"数据处理完成: 年均气温={avg_temp_year:.2f}°C, 年均日降水量={avg_precip_day_year:.2f}mm")
+    logger.info("数据处理完成: 年均气温=%.2f°C, 年均日降水量=%.2fmm", avg_temp_year, avg_precip_day_year)
     
     return avg_temp_year, avg_precip_day_year
 
@@ -166,7 +500,7 @@ def get_city_weather(province: str, city: str, year: int, api_key: str, lat: flo
     """
     模块主函数，由中央调度器调用。
     """
-    logger.info(f"使用和风天气(QWeather)模块处理 {province} - {city} ({year})")
+    logger.info("使用和风天气(QWeather)模块处理 %s - %s (%s)", province, city, year)
     
     raw_data = get_weather_data(city, lat, lon, year, api_key)
     if not raw_data:
@@ -3,36 +3,77 @@
 
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
 import csv
 import os
 import time
 import random
 import hashlib
 import concurrent.futures
-import threading
+import asyncio
 import logging
+import queue
+import atexit
+from logging.handlers import QueueHandler, QueueListener, MemoryHandler
 from datetime import datetime
 from pathlib import Path
+from urllib.parse import quote
 from typing import Dict, Any, List, Tuple, Optional, Union, Set
 from functools import lru_cache
 
 # 导入断点管理器
 from .checkpoint_manager import CheckpointManager
+from .http_utils import parse_retry_after
 
-# 配置日志
+# 配置日志：工作线程只把日志记录放入队列，由后台监听线程统一写入文件和控制台，
+# 不再在每条日志上争用输出处理器的锁；日志文件先在内存中攒够一批再写盘，
+# 遇到ERROR及以上级别的记录或退出时立即写出
+_LOG_QUEUE: queue.SimpleQueue = queue.SimpleQueue()
+_LOG_LISTENER = QueueListener(
+    _LOG_QUEUE,
+    MemoryHandler(1024, flushLevel=logging.ERROR,
+                  target=logging.FileHandler(Path(__file__).resolve().parent / 'visualcrossing.log')),
+    logging.StreamHandler()
+)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'visualcrossing.log')),
-        logging.StreamHandler()
-    ]
+    handlers=[QueueHandler(_LOG_QUEUE)]
 )
+_LOG_LISTENER.start()
+# 退出时等待队列中剩余的日志写完
+atexit.register(_LOG_LISTENER.stop)
 logger = logging.getLogger(__name__)
 
 # 数据源名称
 DATA_SOURCE = "visualcrossing"
 
+# 缓存目录，由 main() 在开始时创建一次，而不是每次读写缓存都检查
+CACHE_DIR = Path('storage/cache')
+
+# 已完成的城市攒够多少个时批量写入断点
+CHECKPOINT_BATCH_SIZE = 10
+
+# Timeline API 地址
+API_BASE_URL = "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline"
+
+# 下载与解析流水线中，解析响应额外使用的线程数
+PARSE_WORKERS = 2
+
+# 同时处理的省份数，各省份平分并行请求数，总并发不超过 max_workers
+PROVINCE_WORKERS = 4
+
+# 连接池大小，至少能容纳默认的并行线程数和配置中常见的并行线程数
+POOL_SIZE = 16
+
+# 模块级共享会话，所有请求复用保持连接的TCP/TLS连接，省去每次请求的握手开销；
+# 重试由 get_weather_data 自行处理
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=0))
+# 显式声明接受压缩的响应体，全年的每日数据压缩后体积小得多
+_SESSION.headers['Accept-Encoding'] = ACCEPT_ENCODING
+
 
 class APIRateLimitException(Exception):
     """API请求频率限制异常"""
@@ -44,6 +85,7 @@ class APIRequestException(Exception):
     pass
 
 
+@lru_cache(maxsize=1)
 def load_config() -> Dict[str, Any]:
     """
     加载配置文件，获取API密钥和其他配置信息
@@ -57,16 +99,16 @@ def load_config() -> Dict[str, Any]:
             # 尝试查找上级目录中的配置文件
             config_path = Path('../config.json')
         
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
+        config = json.loads(config_path.read_bytes())
         return config['visualcrossing']
     except Exception as e:
         raise FileNotFoundError(f"加载配置文件失败: {e}")
 
 
+@lru_cache(maxsize=1)
 def load_city_list() -> Dict[str, Any]:
     """
-    加载城市列表数据
+    加载城市列表数据，整个运行期间只读取和解析一次，之后直接返回缓存的结果
     
     返回:
         Dict[str, Any]: 包含城市信息的字典
@@ -77,12 +119,29 @@ def load_city_list() -> Dict[str, Any]:
             # 尝试查找上级目录中的城市列表文件
             city_list_path = Path('../city_list.json')
         
-        with open(city_list_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return json.loads(city_list_path.read_bytes())
     except Exception as e:
         raise FileNotFoundError(f"加载城市列表失败: {e}")
 
 
+@lru_cache(maxsize=1)
+def load_city_coordinates() -> Dict[Tuple[str, str], Optional[Tuple[float, float]]]:
+    """
+    把城市列表展开为 (省份, 城市) -> (纬度, 经度) 的扁平字典，只在首次调用时构建
+    
+    返回:
+        Dict[Tuple[str, str], Optional[Tuple[float, float]]]: 没有经纬度信息的城市对应None
+    """
+    coordinates = {}
+    for province, cities in load_city_list()["city"].items():
+        for city, city_info in cities.items():
+            if "latitude" in city_info and "longitude" in city_info:
+                coordinates[(province, city)] = (city_info["latitude"], city_info["longitude"])
+            else:
+                coordinates[(province, city)] = None
+    return coordinates
+
+
 # 以下函数已被CheckpointManager替代，保留函数签名以兼容旧代码
 def load_checkpoint(province: str, year: int) -> Dict[str, Any]:
     """
@@ -132,13 +191,10 @@ def calculate_exponential_backoff(retry_number: int, base_delay: float = 1.0, ji
     返回:
         float: 计算后的延迟时间（秒）
     """
-    # 计算指数退避时间: base_delay * 2^retry_number
-    delay = base_delay * (2 ** retry_number)
-    # 添加随机抖动，避免多个请求同时重试
-    max_jitter = delay * jitter
-    actual_jitter = random.uniform(0, max_jitter)
-    
-    return delay + actual_jitter
+    # 计算指数退避时间: base_delay * 2^retry_number，用整数移位代替幂运算
+    delay = base_delay * (1 << retry_number)
+    # 添加 [0, delay * jitter) 的随机抖动，避免多个请求同时重试
+    return delay * (1.0 + jitter * random.random())
 
 
 def get_cache_key(location: str, year: int) -> str:
@@ -152,9 +208,22 @@ def get_cache_key(location: str, year: int) -> str:
     返回:
         str: 缓存键
     """
-    # 使用MD5生成唯一的缓存键
-    key_str = f"{location}_{year}"
-    return hashlib.md5(key_str.encode()).hexdigest()
+    # 位置经URL编码后可直接用作文件名，不同的 (位置, 年份) 不会得到相同的键，无需再做哈希
+    return f"{quote(location, safe='')}_{year}"
+
+
+def get_legacy_cache_key(location: str, year: int) -> str:
+    """
+    生成旧版本使用的MD5缓存键，仅用于迁移旧的缓存文件
+    
+    参数:
+        location (str): 位置信息
+        year (int): 年份
+        
+    返回:
+        str: 旧版缓存键
+    """
+    return hashlib.md5(f"{location}_{year}".encode()).hexdigest()
 
 
 def get_cache_path(cache_key: str) -> Path:
@@ -167,9 +236,7 @@ def get_cache_path(cache_key: str) -> Path:
     返回:
         Path: 缓存文件路径
     """
-    cache_dir = Path('storage/cache')
-    cache_dir.mkdir(parents=True, exist_ok=True)
-    return cache_dir / f"{cache_key}.json"
+    return CACHE_DIR / f"{cache_key}.json"
 
 
 def save_to_cache(cache_key: str, data: Dict[str, Any]) -> None:
@@ -182,10 +249,20 @@ def save_to_cache(cache_key: str, data: Dict[str, Any]) -> None:
     """
     try:
         cache_path = get_cache_path(cache_key)
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False)
+        # json.dumps 走C编码器一次生成整段文本，json.dump 则在Python层逐块写入；
+        # 紧凑分隔符去掉多余空格，缓存文件更小
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        # 先写入临时文件再改名，进程中途退出也不会留下写了一半的缓存文件
+        tmp_path = cache_path.with_suffix('.json.tmp')
+        try:
+            tmp_path.write_bytes(payload)
+        except FileNotFoundError:
+            # 未经 main() 调用时缓存目录可能不存在，只在这种情况下创建
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(payload)
+        os.replace(tmp_path, cache_path)
     except Exception as e:
-        logger.error(f"保存缓存失败: {str(e)}")
+        logger.error("保存缓存失败: %s", e)
 
 
 def load_from_cache(cache_key: str) -> Optional[Dict[str, Any]]:
@@ -201,43 +278,52 @@ def load_from_cache(cache_key: str) -> Optional[Dict[str, Any]]:
     try:
         cache_path = get_cache_path(cache_key)
         if cache_path.exists():
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            # 直接解析原始字节，省去先解码为字符串的一步
+            return json.loads(cache_path.read_bytes())
     except Exception as e:
-        logger.error(f"读取缓存失败: {str(e)}")
+        logger.error("读取缓存失败: %s", e)
     return None
 
 
-@lru_cache(maxsize=128)
-def get_weather_data(location: str, year: int, api_key: str, max_retries: int = 5, base_delay: float = 1.0) -> Optional[Dict[str, Any]]:
+def load_cached_weather_data(location: str, year: int) -> Optional[Dict[str, Any]]:
     """
-    从VisualCrossing API获取指定位置和年份的天气数据
+    从磁盘缓存读取指定位置和年份的天气数据，旧版本按MD5命名的缓存文件命中时改名为新的文件名
     
     参数:
         location (str): 位置信息（城市名称或经纬度）
         year (int): 年份
-        api_key (str): API密钥
-        max_retries (int): 最大重试次数
-        base_delay (float): 基础延迟时间（秒）
         
     返回:
-        Optional[Dict[str, Any]]: 包含天气数据的字典，获取失败则返回None
-        
-    异常:
-        APIRateLimitException: API请求频率超出限制
-        APIRequestException: API请求出错
+        Optional[Dict[str, Any]]: 缓存的数据，未命中时返回None
     """
-    # 检查缓存
     cache_key = get_cache_key(location, year)
     cached_data = load_from_cache(cache_key)
+    if not cached_data:
+        legacy_path = get_cache_path(get_legacy_cache_key(location, year))
+        if legacy_path.exists():
+            cached_data = load_from_cache(legacy_path.stem)
+            if cached_data:
+                os.replace(legacy_path, get_cache_path(cache_key))
     if cached_data:
-        logger.info(f"从缓存加载 {location} {year}年 的数据")
+        logger.debug("从缓存加载 %s %s年 的数据", location, year)
         return cached_data
+    return None
+
+
+def build_weather_request(location: str, year: int, api_key: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    构建获取全年每日数据的请求地址和参数，重试时直接复用
     
-    # 构建API请求URL
-    base_url = "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline"
-    start_date = f"{year}-01-01"
-    end_date = f"{year}-12-31"
+    参数:
+        location (str): 位置信息（城市名称或经纬度）
+        year (int): 年份
+        api_key (str): API密钥
+        
+    返回:
+        Tuple[str, Dict[str, Any]]: (请求地址, 请求参数)
+    """
+    # 对位置进行URL编码
+    url = f"{API_BASE_URL}/{quote(location)}/{year}-01-01/{year}-12-31"
     
     # 构建请求参数
     params = {
@@ -248,52 +334,173 @@ def get_weather_data(location: str, year: int, api_key: str, max_retries: int =
         'contentType': 'json',     # 明确指定返回JSON格式
         'lang': 'zh'               # 使用中文返回可翻译的字段
     }
+    return url, params
+
+
+def request_weather_data(url: str, params: Dict[str, Any], location: str) -> Tuple[Optional[bytes], bool, Optional[float]]:
+    """
+    发送一次请求，只下载响应体，不做解析、重试和等待
     
-    retries = 0
-    while retries < max_retries:
-        try:
-            # 对位置进行URL编码
-            encoded_location = requests.utils.quote(location)
-            url = f"{base_url}/{encoded_location}/{start_date}/{end_date}"
-            
-            # 计算指数退避延迟
-            if retries > 0:
-                delay = calculate_exponential_backoff(retries - 1, base_delay)
-                logger.info(f"尝试请求: {location} (第{retries+1}次尝试，等待{delay:.2f}秒后)")
-                time.sleep(delay)
+    参数:
+        url (str): 请求地址
+        params (Dict[str, Any]): 请求参数
+        location (str): 位置信息，用于日志
+        
+    返回:
+        Tuple[Optional[bytes], bool, Optional[float]]:
+            (解压后的响应体，失败时为None; 是否被限流; 服务器通过 Retry-After 给出的等待秒数)
+    """
+    try:
+        # stream=True 时响应体留在连接上，成功时一次读出完整响应体，
+        # 不经过 requests 按10KB分块读取再拼接的过程
+        response = _SESSION.get(url, params=params, timeout=30, stream=True)  # 添加超时设置
+        
+        if response.status_code == 200:
+            logger.debug("成功获取 %s 的数据", location)
+            # 由urllib3解压后读出原始字节，读完后连接自动放回连接池
+            response.raw.decode_content = True
+            return response.raw.read(), False, None
+        elif response.status_code == 429:
+            # 请求过多，API限制；响应体不需要，关闭响应释放连接
+            response.close()
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                logger.warning("API请求频率限制，按 Retry-After 等待 %.0f 秒后重试...", retry_after)
             else:
-                logger.info(f"尝试请求: {location} (第{retries+1}次尝试)")
-            
-            response = requests.get(url, params=params, timeout=30)  # 添加超时设置
-            
-            if response.status_code == 200:
-                logger.info(f"成功获取 {location} 的数据")
-                data = response.json()
-                # 保存到缓存
-                save_to_cache(cache_key, data)
+                logger.warning("API请求频率限制，将使用指数退避策略重试...")
+            return None, True, retry_after
+        else:
+            error_msg = f"获取数据失败: HTTP {response.status_code} - {response.text}"
+            logger.error(error_msg)
+    except requests.exceptions.Timeout:
+        logger.warning("请求超时，将使用指数退避策略重试...")
+    except requests.exceptions.RequestException as e:
+        logger.warning("请求出错: %s，将使用指数退避策略重试...", e)
+    except Exception as e:
+        logger.warning("读取响应时出错: %s，将使用指数退避策略重试...", e)
+    return None, False, None
+
+
+def store_weather_data(body: bytes, location: str, year: int) -> Optional[Dict[str, Any]]:
+    """
+    解析下载的响应体并写入缓存
+    
+    参数:
+        body (bytes): 解压后的响应体
+        location (str): 位置信息（城市名称或经纬度）
+        year (int): 年份
+        
+    返回:
+        Optional[Dict[str, Any]]: 解析后的天气数据，响应体不是有效的JSON时返回None
+    """
+    try:
+        # 直接解析原始字节，省去先解码为字符串的一步
+        data = json.loads(body)
+    except ValueError as e:
+        logger.warning("处理数据时出错: %s，将使用指数退避策略重试...", e)
+        return None
+    # 保存到缓存
+    save_to_cache(get_cache_key(location, year), data)
+    return data
+
+
+def get_weather_data(location: str, year: int, api_key: str, max_retries: int = 5, base_delay: float = 1.0) -> Optional[Dict[str, Any]]:
+    """
+    从VisualCrossing API获取指定位置和年份的天气数据，结果按 (位置, 年份) 缓存在磁盘上
+    
+    参数:
+        location (str): 位置信息（城市名称或经纬度）
+        year (int): 年份
+        api_key (str): API密钥
+        max_retries (int): 最大重试次数
+        base_delay (float): 基础延迟时间（秒）
+        
+    返回:
+        Optional[Dict[str, Any]]: 包含天气数据的字典，获取失败则返回None
+        
+    异常:
+        APIRateLimitException: API请求频率超出限制
+        APIRequestException: API请求出错
+    """
+    # 检查缓存
+    cached_data = load_cached_weather_data(location, year)
+    if cached_data:
+        return cached_data
+    
+    url, params = build_weather_request(location, year, api_key)
+    throttled = False
+    # 服务器通过 Retry-After 给出的等待时间，优先于自行计算的指数退避
+    retry_after: Optional[float] = None
+    for retries in range(max_retries):
+        # 计算指数退避延迟
+        if retries > 0:
+            delay = retry_after if retry_after is not None else calculate_exponential_backoff(retries - 1, base_delay)
+            logger.info("尝试请求: %s (第%s次尝试，等待%.2f秒后)", location, retries + 1, delay)
+            time.sleep(delay)
+        else:
+            logger.debug("尝试请求: %s (第%s次尝试)", location, retries + 1)
+        
+        body, throttled, retry_after = request_weather_data(url, params, location)
+        if body is not None:
+            data = store_weather_data(body, location, year)
+            if data is not None:
                 return data
-            elif response.status_code == 429:
-                # 请求过多，API限制
-                logger.warning(f"API请求频率限制，将使用指数退避策略重试...")
-                retries += 1
-                # 如果已经到达最大重试次数，抛出异常
-                if retries >= max_retries:
-                    raise APIRateLimitException(f"API请求频率限制，达到最大重试次数({max_retries})")
-            else:
-                error_msg = f"获取数据失败: HTTP {response.status_code} - {response.text}"
-                logger.error(error_msg)
-                retries += 1
-        except requests.exceptions.Timeout:
-            logger.warning(f"请求超时，将使用指数退避策略重试...")
-            retries += 1
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"请求出错: {str(e)}，将使用指数退避策略重试...")
-            retries += 1
-        except Exception as e:
-            logger.warning(f"处理数据时出错: {str(e)}，将使用指数退避策略重试...")
-            retries += 1
     
-    # 所有尝试都失败
+    # 所有尝试都失败，最后一次仍被限流时按频率限制上报
+    if throttled:
+        raise APIRateLimitException(f"API请求频率限制，达到最大重试次数({max_retries})")
+    raise APIRequestException(f"获取 {location} 的数据失败，已尝试 {max_retries} 次")
+
+
+async def get_weather_data_async(location: str, year: int, api_key: str, semaphore: asyncio.Semaphore,
+                                 executor: concurrent.futures.ThreadPoolExecutor,
+                                 max_retries: int = 5, base_delay: float = 1.0) -> Optional[Dict[str, Any]]:
+    """
+    get_weather_data 的协程版本：每次请求在线程池中执行，只在下载期间占用一个并发名额，
+    解析和退避等待都不占名额；退避用 asyncio.sleep，等待期间不占线程，其他城市的请求可以继续进行
+    
+    参数:
+        location (str): 位置信息（城市名称或经纬度）
+        year (int): 年份
+        api_key (str): API密钥
+        semaphore (asyncio.Semaphore): 限制同时进行的请求数
+        executor (concurrent.futures.ThreadPoolExecutor): 执行阻塞请求的线程池
+        max_retries (int): 最大重试次数
+        base_delay (float): 基础延迟时间（秒）
+        
+    返回:
+        Optional[Dict[str, Any]]: 包含天气数据的字典，获取失败则返回None
+        
+    异常:
+        APIRateLimitException: API请求频率超出限制
+        APIRequestException: API请求出错
+    """
+    loop = asyncio.get_running_loop()
+    cached_data = await loop.run_in_executor(executor, load_cached_weather_data, location, year)
+    if cached_data:
+        return cached_data
+    
+    url, params = build_weather_request(location, year, api_key)
+    throttled = False
+    retry_after: Optional[float] = None
+    for retries in range(max_retries):
+        if retries > 0:
+            delay = retry_after if retry_after is not None else calculate_exponential_backoff(retries - 1, base_delay)
+            logger.info("尝试请求: %s (第%s次尝试，等待%.2f秒后)", location, retries + 1, delay)
+            await asyncio.sleep(delay)
+        else:
+            logger.debug("尝试请求: %s (第%s次尝试)", location, retries + 1)
+        
+        async with semaphore:
+            body, throttled, retry_after = await loop.run_in_executor(executor, request_weather_data, url, params, location)
+        # 下载完成即释放并发名额，解析和写缓存与下一个请求的网络等待重叠进行
+        if body is not None:
+            data = await loop.run_in_executor(executor, store_weather_data, body, location, year)
+            if data is not None:
+                return data
+    
+    if throttled:
+        raise APIRateLimitException(f"API请求频率限制，达到最大重试次数({max_retries})")
     raise APIRequestException(f"获取 {location} 的数据失败，已尝试 {max_retries} 次")
 
 
@@ -312,7 +519,7 @@ def process_weather_data(data: Dict[str, Any]) -> Tuple[Optional[float], Optiona
         return None, None
     
     if 'days' not in data:
-        logger.error(f"错误: 数据中没有'days'字段，返回的数据结构: {list(data.keys())}")
+        logger.error("错误: 数据中没有'days'字段，返回的数据结构: %s", list(data.keys()))
         return None, None
     
     days = data['days']
@@ -320,27 +527,36 @@ def process_weather_data(data: Dict[str, Any]) -> Tuple[Optional[float], Optiona
         logger.error("错误: 天气数据天数为0")
         return None, None
     
-    # 计算有效天数（包含温度数据的天数）
-    valid_temp_days = [day for day in days if 'temp' in day and day['temp'] is not None]
-    valid_solar_days = [day for day in days if 'solarenergy' in day and day['solarenergy'] is not None]
-    
-    if len(valid_temp_days) == 0:
+    # 一次遍历同时累计温度和日照能量的总和与有效天数，不再构建中间列表
+    total_temp = 0.0
+    temp_days = 0
+    total_solar_energy = 0.0
+    solar_days = 0
+    for day in days:
+        temp = day.get('temp')
+        if temp is not None:
+            total_temp += temp
+            temp_days += 1
+        solar_energy = day.get('solarenergy')
+        if solar_energy is not None:
+            total_solar_energy += solar_energy
+            solar_days += 1
+    
+    if temp_days == 0:
         logger.error("错误: 没有有效的温度数据")
         avg_temp = None
     else:
         # 计算平均温度
-        total_temp = sum(day['temp'] for day in valid_temp_days)
-        avg_temp = total_temp / len(valid_temp_days)
-        logger.info(f"成功计算平均温度，基于{len(valid_temp_days)}/{len(days)}天的有效数据")
+        avg_temp = total_temp / temp_days
+        logger.debug("成功计算平均温度，基于%s/%s天的有效数据", temp_days, len(days))
     
-    if len(valid_solar_days) == 0:
+    if solar_days == 0:
         logger.error("错误: 没有有效的日照能量数据")
         avg_solar_energy = None
     else:
         # 计算平均日照能量 (solarenergy，单位: MJ/m²)
-        total_solar_energy = sum(day['solarenergy'] for day in valid_solar_days)
-        avg_solar_energy = total_solar_energy / len(valid_solar_days)
-        logger.info(f"成功计算平均日照能量，基于{len(valid_solar_days)}/{len(days)}天的有效数据")
+        avg_solar_energy = total_solar_energy / solar_days
+        logger.debug("成功计算平均日照能量，基于%s/%s天的有效数据", solar_days, len(days))
     
     return avg_temp, avg_solar_energy
 
@@ -369,29 +585,24 @@ def save_to_csv(data: List[List[Union[str, int, float]]], province: str, year: i
         writer = csv.writer(f)
         # 写入表头
         writer.writerow(['province', 'city', 'year', 'avg_temperature', 'avg_solar_energy'])
-        # 写入数据
-        for row in data:
-            writer.writerow([province] + row)
+        # 写入数据：一次 writerows 交给C实现的写入器逐行处理
+        writer.writerows([province, *row] for row in data)
     
-    logger.info(f"数据已保存到 {filepath}")
+    logger.info("数据已保存到 %s", filepath)
     return str(filepath)
 
 
-def get_city_weather(province: str, city: str, year: int, api_key: str) -> Optional[List[Union[str, int, float]]]:
+def get_location_formats(province: str, city: str) -> List[str]:
     """
-    获取单个城市的天气数据
+    按优先级列出查询城市时尝试的位置格式
     
     参数:
         province (str): 省份名称
         city (str): 城市名称
-        year (int): 年份
-        api_key (str): API密钥
         
     返回:
-        Optional[List[Union[str, int, float]]]: [城市名, 年份, 平均温度, 平均日照能量]
+        List[str]: 位置格式列表，有经纬度时以经纬度优先
     """
-    logger.info(f"\n正在获取{province} - {city}的天气数据...")
-    
     # 尝试不同的位置格式
     location_formats = [
         # 1. 使用经纬度（如果有）
@@ -404,131 +615,245 @@ def get_city_weather(province: str, city: str, year: int, api_key: str) -> Optio
     
     # 获取城市数据
     try:
-        city_data = load_city_list()
-        if province in city_data["city"] and city in city_data["city"][province]:
-            city_info = city_data["city"][province][city]
-            if "latitude" in city_info and "longitude" in city_info:
+        city_coordinates = load_city_coordinates()
+        if (province, city) in city_coordinates:
+            coordinates = city_coordinates[(province, city)]
+            if coordinates is not None:
                 # 使用经纬度格式: 纬度,经度
-                lat = city_info["latitude"]
-                lon = city_info["longitude"]
+                lat, lon = coordinates
                 location_formats[0] = f"{lat},{lon}"
             else:
-                logger.warning(f"警告: {province} - {city} 没有经纬度信息")
+                logger.warning("警告: %s - %s 没有经纬度信息", province, city)
                 location_formats[0] = None
         else:
-            logger.warning(f"警告: 在城市列表中找不到 {province} - {city}")
+            logger.warning("警告: 在城市列表中找不到 %s - %s", province, city)
             location_formats[0] = None
     except Exception as e:
-        logger.error(f"获取城市信息时出错: {str(e)}")
+        logger.error("获取城市信息时出错: %s", e)
         location_formats[0] = None
     
     # 过滤掉None值
-    location_formats = [loc for loc in location_formats if loc is not None]
+    return [loc for loc in location_formats if loc is not None]
+
+
+def summarize_city_weather(province: str, city: str, year: int, weather_data: Optional[Dict[str, Any]],
+                           last_error: Optional[Exception]) -> Optional[List[Union[str, int, float]]]:
+    """
+    把获取到的全年数据处理为一行结果
+    
+    参数:
+        province (str): 省份名称
+        city (str): 城市名称
+        year (int): 年份
+        weather_data (Optional[Dict[str, Any]]): API返回的原始天气数据，获取失败时为None
+        last_error (Optional[Exception]): 最后一次获取失败的异常
+        
+    返回:
+        Optional[List[Union[str, int, float]]]: [城市名, 年份, 平均温度, 平均日照能量]
+    """
+    if not weather_data:
+        if last_error:
+            logger.error("%s - %s 数据获取失败: %s", province, city, last_error)
+        else:
+            logger.error("%s - %s 数据获取失败: 所有位置格式均失败", province, city)
+        return None
+    
+    # 处理数据
+    try:
+        avg_temp, avg_solar = process_weather_data(weather_data)
+        
+        if avg_temp is not None and avg_solar is not None:
+            result = [city, year, avg_temp, avg_solar]
+            logger.debug("%s - %s 数据处理完成: 平均温度 %.2f°C, 平均日照能量 %.2f MJ/m²", province, city, avg_temp, avg_solar)
+            return result
+        else:
+            logger.error("%s - %s 数据处理失败: 无法计算平均值", province, city)
+            return None
+    except Exception as e:
+        logger.error("%s - %s 数据处理时出错: %s", province, city, e)
+        return None
+
+
+def get_city_weather(province: str, city: str, year: int, api_key: str) -> Optional[List[Union[str, int, float]]]:
+    """
+    获取单个城市的天气数据
+    
+    参数:
+        province (str): 省份名称
+        city (str): 城市名称
+        year (int): 年份
+        api_key (str): API密钥
+        
+    返回:
+        Optional[List[Union[str, int, float]]]: [城市名, 年份, 平均温度, 平均日照能量]
+    """
+    logger.debug("正在获取%s - %s的天气数据...", province, city)
     
     # 尝试不同的位置格式获取数据
     weather_data = None
     last_error = None
     
-    for location in location_formats:
+    for location in get_location_formats(province, city):
         try:
             weather_data = get_weather_data(location, year, api_key)
             if weather_data:
                 break  # 成功获取数据，跳出循环
         except APIRateLimitException as e:
-            logger.warning(f"API请求频率限制: {e}")
+            logger.warning("API请求频率限制: %s", e)
             # 这是一个严重错误，需要立即中断并等待
             raise
         except APIRequestException as e:
             last_error = e
-            logger.warning(f"尝试位置 '{location}' 失败，尝试下一个位置格式")
+            logger.warning("尝试位置 '%s' 失败，尝试下一个位置格式", location)
         except Exception as e:
             last_error = e
-            logger.warning(f"尝试位置 '{location}' 时发生错误: {str(e)}，尝试下一个位置格式")
+            logger.warning("尝试位置 '%s' 时发生错误: %s，尝试下一个位置格式", location, e)
     
-    if not weather_data:
-        if last_error:
-            logger.error(f"{province} - {city} 数据获取失败: {last_error}")
-        else:
-            logger.error(f"{province} - {city} 数据获取失败: 所有位置格式均失败")
-        return None
+    return summarize_city_weather(province, city, year, weather_data, last_error)
+
+
+def load_cached_city_weather(province: str, city: str, year: int) -> Optional[List[Union[str, int, float]]]:
+    """
+    只从磁盘缓存计算单个城市的天气数据，缓存未命中时不请求API
     
-    # 处理数据
-    try:
-        avg_temp, avg_solar = process_weather_data(weather_data)
+    参数:
+        province (str): 省份名称
+        city (str): 城市名称
+        year (int): 年份
         
-        if avg_temp is not None and avg_solar is not None:
-            result = [city, year, avg_temp, avg_solar]
-            logger.info(f"{province} - {city} 数据处理完成: 平均温度 {avg_temp:.2f}°C, 平均日照能量 {avg_solar:.2f} MJ/m²")
-            return result
-        else:
-            logger.error(f"{province} - {city} 数据处理失败: 无法计算平均值")
-            return None
-    except Exception as e:
-        logger.error(f"{province} - {city} 数据处理时出错: {str(e)}")
-        return None
+    返回:
+        Optional[List[Union[str, int, float]]]: [城市名, 年份, 平均温度, 平均日照能量]，没有缓存时返回None
+    """
+    for location in get_location_formats(province, city):
+        weather_data = load_cached_weather_data(location, year)
+        if weather_data:
+            return summarize_city_weather(province, city, year, weather_data, None)
+    logger.warning("%s - %s %s年 没有缓存数据，跳过", province, city, year)
+    return None
 
 
-def process_city_batch(province: str, cities: List[str], year: int, api_key: str, 
-                     checkpoint_manager: CheckpointManager, lock: threading.Lock) -> List[List[Union[str, int, float]]]:
+async def get_city_weather_async(province: str, city: str, year: int, api_key: str, semaphore: asyncio.Semaphore,
+                                 executor: concurrent.futures.ThreadPoolExecutor) -> Optional[List[Union[str, int, float]]]:
     """
-    处理一批城市的天气数据
+    get_city_weather 的协程版本，请求通过 get_weather_data_async 发出
     
     参数:
         province (str): 省份名称
-        cities (List[str]): 城市列表
+        city (str): 城市名称
         year (int): 年份
         api_key (str): API密钥
-        checkpoint_manager (CheckpointManager): 断点管理器
-        lock (threading.Lock): 线程锁，用于安全更新共享数据
+        semaphore (asyncio.Semaphore): 限制同时进行的请求数
+        executor (concurrent.futures.ThreadPoolExecutor): 执行阻塞请求的线程池
         
     返回:
-        List[List[Union[str, int, float]]]: 处理后的数据列表
+        Optional[List[Union[str, int, float]]]: [城市名, 年份, 平均温度, 平均日照能量]
     """
-    processed_data = []
+    logger.debug("正在获取%s - %s的天气数据...", province, city)
     
-    for city in cities:
+    weather_data = None
+    last_error = None
+    
+    for location in get_location_formats(province, city):
         try:
-            # 检查是否已完成
-            if checkpoint_manager.is_completed(city, year, province):
-                logger.info(f"跳过已完成的任务: {province} - {city} {year}年")
-                continue
-                
-            logger.info(f"处理任务: {province} - {city} {year}年")
-            result = get_city_weather(province, city, year, api_key)
-            
-            if result:
-                processed_data.append(result)
-                # 使用线程锁确保线程安全
-                with lock:
-                    # 标记为已完成
-                    checkpoint_manager.mark_completed(city, year, province)
-                logger.info(f"{province} - {city} {year}年 数据处理完成: 平均温度 {result[2]:.2f}°C, 平均日照能量 {result[3]:.2f} MJ/m²")
-            else:
-                # 使用线程锁确保线程安全
-                with lock:
-                    # 标记为失败
-                    checkpoint_manager.mark_failed(city, year, "获取数据失败", province)
-                logger.error(f"{province} - {city} {year}年 数据获取失败")
-                
+            weather_data = await get_weather_data_async(location, year, api_key, semaphore, executor)
+            if weather_data:
+                break
         except APIRateLimitException as e:
-            logger.warning(f"API请求频率限制: {e}，暂停处理")
-            # 使用线程锁确保线程安全
-            with lock:
-                # 标记为失败
-                checkpoint_manager.mark_failed(city, year, f"API请求频率限制: {e}", province)
-            # 等待一段时间后继续下一个城市
-            time.sleep(10)
+            logger.warning("API请求频率限制: %s", e)
+            raise
+        except APIRequestException as e:
+            last_error = e
+            logger.warning("尝试位置 '%s' 失败，尝试下一个位置格式", location)
         except Exception as e:
-            logger.error(f"处理 {city} 时发生错误: {str(e)}")
-            # 使用线程锁确保线程安全
-            with lock:
-                # 标记为失败
-                checkpoint_manager.mark_failed(city, year, f"处理异常: {str(e)}", province)
+            last_error = e
+            logger.warning("尝试位置 '%s' 时发生错误: %s，尝试下一个位置格式", location, e)
+    
+    return summarize_city_weather(province, city, year, weather_data, last_error)
+
+
+async def process_city(province: str, city: str, year: int, api_key: str,
+                       checkpoint_manager: CheckpointManager, semaphore: asyncio.Semaphore,
+                       executor: concurrent.futures.ThreadPoolExecutor,
+                       completed: List[Tuple[str, int, str]]) -> Optional[List[Union[str, int, float]]]:
+    """
+    处理单个城市的协程：阻塞的API请求交给线程池执行，重试前的退避在事件循环中等待，
+    断点更新在事件循环线程中完成，不需要加锁。
+    已完成的城市先记入 completed，攒够 CHECKPOINT_BATCH_SIZE 个后一次性写入断点
+    
+    参数:
+        province (str): 省份名称
+        city (str): 城市名称
+        year (int): 年份
+        api_key (str): API密钥
+        checkpoint_manager (CheckpointManager): 断点管理器
+        semaphore (asyncio.Semaphore): 限制同时进行的请求数，只在请求期间占用
+        executor (concurrent.futures.ThreadPoolExecutor): 执行阻塞请求的线程池
+        completed (List[Tuple[str, int, str]]): 尚未写入断点的已完成任务 (城市, 年份, 省份)
+        
+    返回:
+        Optional[List[Union[str, int, float]]]: 处理后的数据，失败时返回None
+    """
+    try:
+        logger.debug("处理任务: %s - %s %s年", province, city, year)
+        result = await get_city_weather_async(province, city, year, api_key, semaphore, executor)
+    except APIRateLimitException as e:
+        logger.warning("API请求频率限制: %s，暂停处理", e)
+        checkpoint_manager.mark_failed(city, year, f"API请求频率限制: {e}", province)
+        # 占用一个并发名额等待一段时间，降低整体请求速率
+        async with semaphore:
+            await asyncio.sleep(10)
+        return None
+    except Exception as e:
+        logger.error("处理 %s 时发生错误: %s", city, e)
+        checkpoint_manager.mark_failed(city, year, f"处理异常: {str(e)}", province)
+        return None
     
-    return processed_data
+    if result:
+        completed.append((city, year, province))
+        if len(completed) >= CHECKPOINT_BATCH_SIZE:
+            checkpoint_manager.mark_completed_batch(completed)
+            completed.clear()
+        logger.info("%s - %s %s年 数据处理完成: 平均温度 %.2f°C, 平均日照能量 %.2f MJ/m²", province, city, year, result[2], result[3])
+    else:
+        checkpoint_manager.mark_failed(city, year, "获取数据失败", province)
+        logger.error("%s - %s %s年 数据获取失败", province, city, year)
+    return result
 
 
-def get_province_weather(province: str, year: int, api_key: str, max_workers: int = 5, max_api_calls: int = 0) -> None:
+async def collect_cities_async(province: str, cities: List[str], year: int, api_key: str,
+                               checkpoint_manager: CheckpointManager, max_workers: int) -> List[List[Union[str, int, float]]]:
+    """
+    在一个事件循环中并发处理一个省份的所有待处理城市，每个城市是一个独立任务，
+    某个城市重试较慢时不会拖住其他城市；同时进行的请求数由信号量限制
+    
+    参数:
+        province (str): 省份名称
+        cities (List[str]): 待处理城市列表
+        year (int): 年份
+        api_key (str): API密钥
+        checkpoint_manager (CheckpointManager): 断点管理器
+        max_workers (int): 同时进行的请求数上限
+        
+    返回:
+        List[List[Union[str, int, float]]]: 处理成功的城市数据
+    """
+    semaphore = asyncio.Semaphore(max_workers)
+    completed: List[Tuple[str, int, str]] = []
+    try:
+        # 线程池在请求并发数之外多留 PARSE_WORKERS 个线程，解析响应不必等待下载线程空出
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers + PARSE_WORKERS) as executor:
+            results = await asyncio.gather(
+                *(process_city(province, city, year, api_key, checkpoint_manager, semaphore, executor, completed)
+                  for city in cities)
+            )
+    finally:
+        # 中途退出时也要写入尚未提交的已完成任务
+        checkpoint_manager.mark_completed_batch(completed)
+    return [result for result in results if result]
+
+
+def get_province_weather(province: str, year: int, api_key: str, max_workers: int = 5, max_api_calls: int = 0,
+                         checkpoint_manager: Optional[CheckpointManager] = None) -> None:
     """
     获取指定省份所有城市的天气数据，支持并行处理
     
@@ -538,6 +863,7 @@ def get_province_weather(province: str, year: int, api_key: str, max_workers: in
         api_key (str): API密钥
         max_workers (int): 最大并行工作线程数
         max_api_calls (int): 单次运行的最大API调用次数，0表示不限制
+        checkpoint_manager (Optional[CheckpointManager]): 共用的断点管理器，省略时新建一个
     """
     logger.info(f"\n===== 开始获取{province} {year}年天气数据 =====")
     
@@ -556,8 +882,9 @@ def get_province_weather(province: str, year: int, api_key: str, max_workers: in
         logger.error(f"加载城市列表失败: {str(e)}")
         return
     
-    # 创建断点管理器
-    checkpoint_manager = CheckpointManager(DATA_SOURCE)
+    # 单独调用时创建断点管理器
+    if checkpoint_manager is None:
+        checkpoint_manager = CheckpointManager(DATA_SOURCE)
     
     # 计算总任务数
     total_tasks = len(cities)
@@ -565,12 +892,17 @@ def get_province_weather(province: str, year: int, api_key: str, max_workers: in
     # 更新省份级别的总任务数
     checkpoint_manager.update_stats(total_tasks, province)
     
-    # 获取已完成和失败的城市列表
-    completed_cities = [city for city in cities if checkpoint_manager.is_completed(city, year, province)]
-    failed_cities = [city for city in cities if checkpoint_manager.is_failed(city, year, province)]
-    
-    # 计算待处理城市
-    pending_cities = [city for city in cities if city not in completed_cities and city not in failed_cities]
+    # 一次取出该年份已完成和失败的城市集合，再遍历一次把城市分为已完成、失败和待处理三类
+    completed_set = checkpoint_manager.get_completed_set(year)
+    failed_set = checkpoint_manager.get_failed_set(year)
+    completed_cities, failed_cities, pending_cities = [], [], []
+    for city in cities:
+        if city in completed_set:
+            completed_cities.append(city)
+        elif city in failed_set:
+            failed_cities.append(city)
+        else:
+            pending_cities.append(city)
     
     logger.info(f"总城市数: {len(cities)}")
     logger.info(f"已处理城市数: {len(completed_cities)}")
@@ -587,37 +919,15 @@ def get_province_weather(province: str, year: int, api_key: str, max_workers: in
         logger.info(f"限制API调用次数为{max_api_calls}，将只处理部分城市")
         pending_cities = pending_cities[:max_api_calls]
     
-    # 创建线程锁，用于安全更新共享数据
-    lock = threading.Lock()
+    logger.info(f"将使用{max_workers}个并发请求处理{len(pending_cities)}个城市")
     
-    # 存储处理后的数据
-    all_processed_data = []
+    # 每个城市一个协程，阻塞请求在线程池中执行
+    all_processed_data = asyncio.run(
+        collect_cities_async(province, pending_cities, year, api_key, checkpoint_manager, max_workers)
+    )
     
-    # 计算每个批次的大小，确保工作均匀分配
-    batch_size = max(1, len(pending_cities) // max_workers)
-    if batch_size == 0:
-        batch_size = 1
-    
-    # 将城市分成多个批次
-    city_batches = [pending_cities[i:i+batch_size] for i in range(0, len(pending_cities), batch_size)]
-    
-    logger.info(f"将使用{max_workers}个并行工作线程处理{len(city_batches)}个城市批次")
-    
-    # 使用线程池并行处理
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 提交所有批次的任务
-        future_to_batch = {executor.submit(process_city_batch, province, batch, year, api_key, checkpoint_manager, lock): batch 
-                          for batch in city_batches}
-        
-        # 处理完成的任务
-        for future in concurrent.futures.as_completed(future_to_batch):
-            batch = future_to_batch[future]
-            try:
-                batch_data = future.result()
-                all_processed_data.extend(batch_data)
-                logger.info(f"完成处理城市批次，包含{len(batch)}个城市")
-            except Exception as e:
-                logger.error(f"处理城市批次时发生错误: {str(e)}")
+    # 保存批量缓存中尚未写盘的断点
+    checkpoint_manager.flush()
     
     # 获取统计信息
     stats = checkpoint_manager.get_stats(province)
@@ -629,11 +939,13 @@ def get_province_weather(province: str, year: int, api_key: str, max_workers: in
     logger.info(f"失败的城市-年份对: {stats['failed_tasks']}")
     
     # 获取失败的城市列表
-    failed_cities = [city for city in cities if checkpoint_manager.is_failed(city, year, province)]
+    failed_set = checkpoint_manager.get_failed_set(year)
+    failed_cities = [city for city in cities if city in failed_set]
     if failed_cities:
         logger.info("\n获取失败的城市列表:")
+        failed_tasks = checkpoint_manager.get_failed_tasks()
         for city in sorted(failed_cities):
-            failure_reason = checkpoint_manager.get_failure_reason(city, year, province)
+            failure_reason = failed_tasks.get(city, {}).get(str(year), {}).get('reason', '未知原因')
             logger.info(f"- {city}: {failure_reason}")
     
     # 保存数据到CSV文件
@@ -641,18 +953,19 @@ def get_province_weather(province: str, year: int, api_key: str, max_workers: in
         filepath = save_to_csv(all_processed_data, province, year)
         logger.info(f"数据已保存到 {filepath}")
     else:
-        # 尝试从已处理的城市中重新获取数据并保存
-        completed_cities = [city for city in cities if checkpoint_manager.is_completed(city, year, province)]
+        # 尝试从已处理城市的缓存中恢复数据并保存，不发出任何API请求
+        completed_set = checkpoint_manager.get_completed_set(year)
+        completed_cities = [city for city in cities if city in completed_set]
         if completed_cities:
-            logger.info("尝试从已处理的城市中重新获取数据并保存...")
+            logger.info("尝试从已处理城市的缓存中恢复数据并保存...")
             recovery_data = []
             for city in completed_cities:
                 try:
-                    result = get_city_weather(province, city, year, api_key)
+                    result = load_cached_city_weather(province, city, year)
                     if result:
                         recovery_data.append(result)
                 except Exception as e:
-                    logger.error(f"重新获取 {city} 数据时出错: {str(e)}")
+                    logger.error(f"从缓存恢复 {city} 数据时出错: {str(e)}")
             
             if recovery_data:
                 filepath = save_to_csv(recovery_data, province, year)
@@ -663,7 +976,8 @@ def get_province_weather(province: str, year: int, api_key: str, max_workers: in
             logger.warning("没有新数据可保存")
 
 
-def collect_data_for_years(province: str, years: List[int], api_key: str, max_workers: int = 5, max_api_calls: int = 0) -> None:
+def collect_data_for_years(province: str, years: List[int], api_key: str, max_workers: int = 5, max_api_calls: int = 0,
+                           checkpoint_manager: Optional[CheckpointManager] = None) -> None:
     """
     收集指定省份在多个年份的天气数据
     
@@ -673,13 +987,12 @@ def collect_data_for_years(province: str, years: List[int], api_key: str, max_wo
         api_key (str): API密钥
         max_workers (int): 最大并行工作线程数
         max_api_calls (int): 单次运行的最大API调用次数，0表示不限制
+        checkpoint_manager (Optional[CheckpointManager]): 共用的断点管理器，省略时每个年份各自新建
     """
     for year in years:
         print(f"\n======== 开始处理 {province} {year}年数据 ========")
-        get_province_weather(province, year, api_key, max_workers, max_api_calls)
+        get_province_weather(province, year, api_key, max_workers, max_api_calls, checkpoint_manager)
         print(f"======== 完成处理 {province} {year}年数据 ========\n")
-        # 年份之间添加延时，避免API限制
-        time.sleep(5)
 
 
 def main(provinces=None, years=None, max_workers=5, max_api_calls=20):
@@ -693,7 +1006,7 @@ def main(provinces=None, years=None, max_workers=5, max_api_calls=20):
         max_api_calls (int): 单次运行的最大API调用次数，默认为20，0表示不限制
     """
     # 确保必要的目录存在
-    for directory in [Path('storage'), Path('storage/cache'), Path('storage/checkpoints')]:
+    for directory in [Path('storage'), CACHE_DIR, Path('storage/checkpoints')]:
         directory.mkdir(parents=True, exist_ok=True)
         
     # 设置默认参数
@@ -723,7 +1036,7 @@ def main(provinces=None, years=None, max_workers=5, max_api_calls=20):
         logger.error("请确保config.json文件存在且格式正确")
         return
     
-    # 创建断点管理器
+    # 创建断点管理器，所有省份和年份共用，只加载一次断点文件
     checkpoint_manager = CheckpointManager(DATA_SOURCE)
     
     # 计算总任务数
@@ -736,9 +1049,20 @@ def main(provinces=None, years=None, max_workers=5, max_api_calls=20):
     logger.info(f"单次运行最大API调用次数: {max_api_calls if max_api_calls > 0 else '不限制'}")
     logger.info(f"总任务数: {total_tasks}")
     
-    # 处理每个省份的数据
-    for province in provinces:
-        collect_data_for_years(province, years, api_key, max_workers, max_api_calls)
+    # 多个省份同时处理，共用断点管理器和连接池；遇到频率限制由请求的退避重试处理，省份和年份之间不再固定等待
+    province_workers = max(1, min(len(provinces), PROVINCE_WORKERS, max_workers))
+    workers_per_province = max(1, max_workers // province_workers)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=province_workers, thread_name_prefix="province") as pool:
+        futures = {
+            pool.submit(collect_data_for_years, province, years, api_key, workers_per_province,
+                        max_api_calls, checkpoint_manager): province
+            for province in provinces
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"处理 {futures[future]} 的数据时出错: {str(e)}")
         
     # 获取最终统计信息
     stats = checkpoint_manager.get_stats()
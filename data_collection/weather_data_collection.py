@@ -6,12 +6,16 @@ import os
 import json
 import time
 import logging
-import threading
-import queue
+import asyncio
+import functools
+import itertools
 import random
+import threading
+from array import array
 import pickle
+import sqlite3
 from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, List, Tuple, Optional, Any, Callable, Union
+from typing import Dict, List, Tuple, Optional, Any, Callable, Union, Awaitable, Sequence, Set
 from datetime import datetime
 import csv
 from pathlib import Path
@@ -39,6 +43,8 @@ logger = logging.getLogger(__name__)
 # 使用 Path 对象处理路径，提高跨平台兼容性
 PROJECT_ROOT = Path(__file__).parent.parent
 CACHE_DIR = PROJECT_ROOT / 'data_collection' / 'cache'
+# 所有城市-年份的结果缓存存放在同一个SQLite数据库中，而不是每个键一个文件
+CACHE_DB_PATH = CACHE_DIR / 'weather_cache.sqlite'
 STORAGE_DIR = PROJECT_ROOT / 'storage'
 CONFIG_PATH = PROJECT_ROOT / 'config.json'
 CITY_LIST_PATH = PROJECT_ROOT / 'city_list.json'
@@ -47,6 +53,15 @@ CITY_LIST_PATH = PROJECT_ROOT / 'city_list.json'
 TARGET_YEARS = [2010, 2012, 2014, 2016, 2018, 2020, 2022]
 # 数据源名称，用于断点续传
 DATA_SOURCE = "combined"
+# 已完成任务攒够多少个，或距上次提交超过多少秒时，批量写入断点
+CHECKPOINT_BATCH_SIZE = 32
+CHECKPOINT_BATCH_INTERVAL = 5.0
+# CSV文件的写缓冲大小，每次提交断点前写出的一批结果行先进入缓冲，关闭文件时整体写盘
+CSV_BUFFER_SIZE = 1 << 16
+
+# 缓存数据库连接，首次使用时打开，所有线程共用
+_cache_db: Optional[sqlite3.Connection] = None
+_cache_lock = threading.Lock()
 
 # --- API 服务调度器 ---
 # 将 API 服务名称映射到其处理函数
@@ -56,6 +71,14 @@ API_DISPATCHER: Dict[str, Callable] = {
     "openweather": openweather.get_city_weather,
     "qweather": qweather.get_city_weather,
 }
+# 提供协程版本的API服务：请求之间的等待在事件循环中进行，不会在整个城市-年份期间占住一个线程；
+# 未列出的服务在线程池中调用上面的同步函数
+ASYNC_API_DISPATCHER: Dict[str, Callable[..., Awaitable[Any]]] = {
+    "visualcrossing": visualcrossing.get_city_weather_async,
+    "openweather": openweather.get_city_weather_async,
+}
+# 需要传入经纬度的API服务
+LATLON_SERVICES = frozenset({"openweather", "qweather"})
 
 # --- 自定义异常 ---
 class APIRateLimitException(Exception):
@@ -75,17 +98,17 @@ def ensure_dirs():
     for directory in [CACHE_DIR, STORAGE_DIR]:
         directory.mkdir(parents=True, exist_ok=True)
 
+@functools.lru_cache(maxsize=1)
 def load_config() -> Dict[str, str]:
     """
     从config.json加载所有API配置
     
     返回:
-        Dict[str, str]: API名称到API密钥的映射
+        Dict[str, str]: API名称到API密钥的映射，结果会被缓存，调用方不应修改
     """
     try:
-        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            
+        config = json.loads(CONFIG_PATH.read_bytes())
+        
         api_keys = {}
         for service in API_DISPATCHER:
             if service in config and 'apikey' in config[service] and config[service]['apikey']:
@@ -95,27 +118,27 @@ def load_config() -> Dict[str, str]:
             logger.warning("配置文件中未找到任何有效的API密钥。")
         return api_keys
     except FileNotFoundError:
-        logger.error(f"配置文件未找到: {CONFIG_PATH}")
+        logger.error("配置文件未找到: %s", CONFIG_PATH)
         return {}
     except Exception as e:
-        logger.error(f"加载配置文件时出错: {e}")
+        logger.error("加载配置文件时出错: %s", e)
         return {}
 
+@functools.lru_cache(maxsize=1)
 def load_city_list() -> Dict[str, Any]:
     """
     从city_list.json加载城市列表
     
     返回:
-        Dict: 城市列表字典
+        Dict: 城市列表字典，结果会被缓存，调用方不应修改
     """
     try:
-        with open(CITY_LIST_PATH, 'r', encoding='utf-8') as f:
-            return json.load(f)['city']
+        return json.loads(CITY_LIST_PATH.read_bytes())['city']
     except FileNotFoundError:
-        logger.error(f"城市列表文件未找到: {CITY_LIST_PATH}")
+        logger.error("城市列表文件未找到: %s", CITY_LIST_PATH)
         return {}
     except Exception as e:
-        logger.error(f"加载城市列表时出错: {e}")
+        logger.error("加载城市列表时出错: %s", e)
         return {}
 
 def get_cache_key(city: str, year: int) -> str:
@@ -124,58 +147,123 @@ def get_cache_key(city: str, year: int) -> str:
     """
     return f"combined_{city}_{year}"
 
+def _get_cache_db() -> sqlite3.Connection:
+    """
+    打开缓存数据库（WAL模式），首次调用时建表；调用方需持有 _cache_lock
+    """
+    global _cache_db
+    if _cache_db is None:
+        CACHE_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(CACHE_DB_PATH), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        conn.commit()
+        _cache_db = conn
+    return _cache_db
+
 def save_to_cache(cache_key: str, data: Any):
     """
-    将数据序列化并保存到缓存文件
+    将数据序列化为紧凑的JSON并写入缓存数据库
     """
     try:
-        cache_path = CACHE_DIR / f"{cache_key}.pkl"
-        with open(cache_path, 'wb') as f:
-            pickle.dump(data, f)
-        logger.debug(f"数据已缓存: {cache_key}")
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        with _cache_lock:
+            conn = _get_cache_db()
+            conn.execute("INSERT OR REPLACE INTO cache (key, data) VALUES (?, ?)", (cache_key, payload))
+            conn.commit()
+        logger.debug("数据已缓存: %s", cache_key)
     except Exception as e:
-        logger.error(f"缓存数据时出错: {e}")
+        logger.error("缓存数据时出错: %s", e)
 
 def load_from_cache(cache_key: str) -> Optional[Any]:
     """
-    从缓存文件加载并反序列化数据
+    从缓存数据库加载并反序列化数据；旧版本按文件保存的JSON/pickle缓存在首次读取时迁移到数据库
     """
     try:
-        cache_path = CACHE_DIR / f"{cache_key}.pkl"
-        if cache_path.exists():
-            with open(cache_path, 'rb') as f:
-                data = pickle.load(f)
-            logger.debug(f"从缓存加载数据: {cache_key}")
-            return data
+        with _cache_lock:
+            row = _get_cache_db().execute("SELECT data FROM cache WHERE key = ?", (cache_key,)).fetchone()
+        if row is not None:
+            logger.debug("从缓存加载数据: %s", cache_key)
+            return json.loads(row[0])
+        
+        for legacy_path in (CACHE_DIR / f"{cache_key}.json", CACHE_DIR / f"{cache_key}.pkl"):
+            if legacy_path.exists():
+                if legacy_path.suffix == '.json':
+                    data = json.loads(legacy_path.read_bytes())
+                else:
+                    with open(legacy_path, 'rb') as f:
+                        data = pickle.load(f)
+                save_to_cache(cache_key, data)
+                legacy_path.unlink()
+                logger.debug("已将旧缓存文件迁移到数据库: %s", cache_key)
+                return data
         return None
     except Exception as e:
-        logger.error(f"从缓存加载数据时出错: {e}")
+        logger.error("从缓存加载数据时出错: %s", e)
         return None
 
-def save_to_csv(data: List[List[Any]], province: str, year: int) -> str:
+def load_cached_batch(cache_keys: List[str], chunk_size: int = 500) -> Dict[str, Any]:
     """
-    将最终数据保存到CSV文件
-    """
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    filename = f"{province}_weather_data_{year}_{timestamp}.csv"
-    filepath = STORAGE_DIR / filename
+    一次查询批量读取多个缓存键，每 chunk_size 个键一条 IN 查询；旧版本的缓存文件不在这里处理，
+    未命中的键仍由 load_from_cache 逐个检查并迁移
     
+    参数:
+        cache_keys: 缓存键列表
+        chunk_size: 每条查询包含的键数，不超过SQLite的参数个数上限
+        
+    返回:
+        Dict[str, Any]: 命中的缓存键到反序列化数据的映射
+    """
+    cached = {}
     try:
-        with open(filepath, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['province', 'city', 'year', 'avg_temperature', 'avg_solar_energy/precip'])
-            for row in data:
-                # 确保写入的数据格式为 [province, city, year, ...]
-                writer.writerow([province] + row)
-        logger.info(f"数据已保存到: {filepath}")
-        return str(filepath)
+        with _cache_lock:
+            conn = _get_cache_db()
+            for start in range(0, len(cache_keys), chunk_size):
+                chunk = cache_keys[start:start + chunk_size]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(f"SELECT key, data FROM cache WHERE key IN ({placeholders})", chunk).fetchall()
+                cached.update(rows)
+        return {key: json.loads(data) for key, data in cached.items()}
     except Exception as e:
-        logger.error(f"保存数据到CSV时出错: {e}")
-        return ""
+        logger.error("批量读取缓存时出错: %s", e)
+        return {}
+
+# 结果CSV的表头
+CSV_HEADER = ['province', 'city', 'year', 'avg_temperature', 'avg_solar_energy/precip']
+
+
+def _api_kwargs(api_service: str, province: str, city: str, year: int, lat: float, lon: float,
+                api_key: str) -> Dict[str, Any]:
+    """
+    根据API服务的函数签名组装调用参数
+    """
+    kwargs = {"province": province, "city": city, "year": year, "api_key": api_key}
+    if api_service in LATLON_SERVICES:
+        kwargs["lat"] = lat
+        kwargs["lon"] = lon
+    return kwargs
+
+def _log_api_error(api_service: str, e: Exception):
+    """
+    记录某个API服务失败的原因，频率限制只记警告
+    """
+    if "rate limit" in str(e).lower() or "429" in str(e):
+        logger.warning("%s API请求频率限制，尝试下一个API服务: %s", api_service, e)
+    else:
+        logger.error("使用 %s 获取数据时发生意外错误: %s", api_service, e, exc_info=True)
+
+def _all_apis_failed(province: str, city: str, year: int, last_exception: Optional[Exception]) -> AllAPIsFailedException:
+    """
+    构造所有API服务都失败时抛出的异常
+    """
+    error_message = f"所有API服务都未能获取 {province}-{city} {year}年 的数据。"
+    if last_exception:
+        error_message += f" 最后一次错误: {last_exception}"
+    return AllAPIsFailedException(error_message)
 
 def get_weather_data_with_fallback(
     province: str, city: str, year: int, lat: float, lon: float, 
-    api_keys: Dict[str, str], api_order: List[str]
+    api_keys: Dict[str, str], api_order: Sequence[str]
 ) -> List[Union[str, int, float]]:
     """
     核心调度函数：使用多个API服务获取天气数据，如果一个API服务失败，则自动尝试下一个。
@@ -190,161 +278,354 @@ def get_weather_data_with_fallback(
     cache_key = get_cache_key(city, year)
     cached_data = load_from_cache(cache_key)
     if cached_data is not None:
-        logger.info(f"使用缓存数据: {province}-{city} {year}年")
+        logger.info("使用缓存数据: %s-%s %s年", province, city, year)
         return cached_data
     
     # 尝试每个API服务
     last_exception = None
     for api_service in api_order:
         if api_service not in api_keys:
-            logger.debug(f"跳过 {api_service}，未配置API密钥")
+            logger.debug("跳过 %s，未配置API密钥", api_service)
             continue
             
         try:
-            logger.info(f"尝试使用 {api_service} 获取 {province}-{city} {year}年 的数据")
+            logger.info("尝试使用 %s 获取 %s-%s %s年 的数据", api_service, province, city, year)
             api_func = API_DISPATCHER[api_service]
-            
-            # 根据函数签名传递参数
-            if api_service in ["openweather", "qweather"]:
-                result = api_func(province=province, city=city, year=year, api_key=api_keys[api_service], lat=lat, lon=lon)
-            else:
-                result = api_func(province=province, city=city, year=year, api_key=api_keys[api_service])
+            result = api_func(**_api_kwargs(api_service, province, city, year, lat, lon, api_keys[api_service]))
 
             if result and isinstance(result, list):
-                logger.info(f"成功使用 {api_service} 获取 {province}-{city} {year}年 的数据")
+                logger.info("成功使用 %s 获取 %s-%s %s年 的数据", api_service, province, city, year)
                 save_to_cache(cache_key, result)
                 return result
             else:
-                logger.warning(f"{api_service} 未能获取 {province}-{city} {year}年 的有效数据，尝试下一个API服务")
+                logger.warning("%s 未能获取 %s-%s %s年 的有效数据，尝试下一个API服务", api_service, province, city, year)
                 
         except Exception as e:
             last_exception = e
-            if "rate limit" in str(e).lower() or "429" in str(e):
-                logger.warning(f"{api_service} API请求频率限制，尝试下一个API服务: {e}")
-            else:
-                logger.error(f"使用 {api_service} 获取数据时发生意外错误: {e}", exc_info=True)
+            _log_api_error(api_service, e)
     
     # 所有API服务都失败
-    error_message = f"所有API服务都未能获取 {province}-{city} {year}年 的数据。"
-    if last_exception:
-        error_message += f" 最后一次错误: {last_exception}"
-    
-    raise AllAPIsFailedException(error_message)
+    raise _all_apis_failed(province, city, year, last_exception)
 
-
-def worker(
-    task_queue: queue.Queue, 
-    results: List, 
-    api_keys: Dict[str, str], 
-    checkpoint_manager: CheckpointManager, 
-    lock: threading.Lock
-):
+async def get_weather_data_with_fallback_async(
+    province: str, city: str, year: int, lat: float, lon: float,
+    api_keys: Dict[str, str], api_order: Sequence[str],
+    semaphores: Dict[str, asyncio.Semaphore], executor: ThreadPoolExecutor
+) -> List[Union[str, int, float]]:
     """
-    工作线程函数，从队列中获取任务并处理。
+    get_weather_data_with_fallback 的协程版本。有协程版本的API服务直接在事件循环中等待，
+    其余服务在线程池中调用；每个API服务各用一个信号量限制并发，互不占用对方的名额。
+    
+    返回:
+        List: 处理后的天气数据 [city, year, avg_temp, avg_value]
+    
+    异常:
+        AllAPIsFailedException: 如果所有API都尝试失败
     """
-    while not task_queue.empty():
-        try:
-            province, city, year, lat, lon = task_queue.get_nowait()
-        except queue.Empty:
+    loop = asyncio.get_running_loop()
+    
+    # 检查缓存
+    cache_key = get_cache_key(city, year)
+    cached_data = await loop.run_in_executor(executor, load_from_cache, cache_key)
+    if cached_data is not None:
+        logger.info("使用缓存数据: %s-%s %s年", province, city, year)
+        return cached_data
+    
+    # 尝试每个API服务
+    last_exception = None
+    for api_service in api_order:
+        if api_service not in api_keys:
+            logger.debug("跳过 %s，未配置API密钥", api_service)
             continue
-
-        thread_name = threading.current_thread().name
-        logger.debug(f"线程 {thread_name} 获取任务: {province}-{city} {year}年")
-
+            
         try:
-            # 检查是否已完成
-            if checkpoint_manager.is_completed(city, year, province):
-                logger.info(f"跳过已完成的任务: {province}-{city} {year}年")
-                continue
-
-            # 随机化API尝试顺序以分散负载
-            api_order = list(API_DISPATCHER.keys())
-            random.shuffle(api_order)
+            logger.info("尝试使用 %s 获取 %s-%s %s年 的数据", api_service, province, city, year)
+            kwargs = _api_kwargs(api_service, province, city, year, lat, lon, api_keys[api_service])
+            if api_service in ASYNC_API_DISPATCHER:
+                result = await ASYNC_API_DISPATCHER[api_service](
+                    **kwargs, semaphore=semaphores[api_service], executor=executor
+                )
+            else:
+                async with semaphores[api_service]:
+                    result = await loop.run_in_executor(executor, functools.partial(API_DISPATCHER[api_service], **kwargs))
 
-            result = get_weather_data_with_fallback(province, city, year, lat, lon, api_keys, api_order)
-            
-            with lock:
-                results.append(result)
-                checkpoint_manager.mark_completed(city, year, province)
-            logger.info(f"线程 {thread_name} 成功处理: {province}-{city} {year}年")
-
-        except AllAPIsFailedException as e:
-            with lock:
-                checkpoint_manager.mark_failed(city, year, str(e), province)
-            logger.error(f"线程 {thread_name} 失败: {e}")
+            if result and isinstance(result, list):
+                logger.info("成功使用 %s 获取 %s-%s %s年 的数据", api_service, province, city, year)
+                await loop.run_in_executor(executor, save_to_cache, cache_key, result)
+                return result
+            else:
+                logger.warning("%s 未能获取 %s-%s %s年 的有效数据，尝试下一个API服务", api_service, province, city, year)
+                
         except Exception as e:
-            with lock:
-                checkpoint_manager.mark_failed(city, year, f"未知异常: {e}", province)
-            logger.critical(f"线程 {thread_name} 发生严重错误: {e}", exc_info=True)
-        finally:
-            task_queue.task_done()
+            last_exception = e
+            _log_api_error(api_service, e)
+    
+    # 所有API服务都失败
+    raise _all_apis_failed(province, city, year, last_exception)
 
 
-def collect_data_for_province(
-    province: str, 
-    years: List[int], 
-    api_keys: Dict[str, str], 
-    city_data: Dict[str, Any],
-    max_workers: int
-):
+class CompletedBatch:
     """
-    为单个省份收集指定年份的所有城市数据。
+    缓存已完成的任务，攒够 batch_size 个或距上次提交超过 interval 秒时
+    一次性写入断点，减少断点日志的写入次数。提交断点前先把这些任务的结果行写入CSV，
+    断点记为已完成的任务，其结果一定已经写出。只在事件循环线程中使用，不需要加锁。
     """
-    if province not in city_data:
-        logger.error(f"在城市列表中未找到省份: {province}")
-        return
-
-    cities_in_province = city_data[province]
-    
-    for year in years:
-        logger.info(f"\n===== 开始处理 {province} {year}年 天气数据 =====")
+    def __init__(self, checkpoint_manager: CheckpointManager, csv_writer: "CsvResultWriter",
+                 batch_size: int = CHECKPOINT_BATCH_SIZE, interval: float = CHECKPOINT_BATCH_INTERVAL):
+        self.checkpoint_manager = checkpoint_manager
+        self.csv_writer = csv_writer
+        self.batch_size = batch_size
+        self.interval = interval
+        self._tasks: List[Tuple[str, int, str]] = []
+        self._last_commit = time.monotonic()
+
+    def add(self, city: str, year: int, province: str):
+        """
+        记录一个已完成的任务，满足条件时提交整批
+        """
+        self._tasks.append((city, year, province))
+        if len(self._tasks) >= self.batch_size or time.monotonic() - self._last_commit >= self.interval:
+            self.commit()
+
+    def commit(self):
+        """
+        先写出CSV中暂存的结果行，再将缓存的已完成任务写入断点；
+        结果未能写出的任务不标记完成，下次运行会重新处理
+        """
+        if self._tasks:
+            failed_files = self.csv_writer.flush()
+            tasks = [task for task in self._tasks if (task[2], task[1]) not in failed_files]
+            if tasks:
+                self.checkpoint_manager.mark_completed_batch(tasks)
+            self._tasks = []
+        self._last_commit = time.monotonic()
+
+
+class CsvResultWriter:
+    """
+    把任务结果写入对应 (省份, 年份) 的CSV文件，不在内存中攒齐整年的结果。
+    同一次运行的文件共用一个时间戳；结果行先暂存在内存中，由 CompletedBatch 在每次提交断点前
+    调用 flush 一起写出，每个文件一次 writerows。写出时才打开文件，首次写出时创建文件并写入表头，
+    之后以追加方式写入，写完立即关闭，不会在整个运行期间为每个 (省份, 年份) 占用一个文件描述符。
+    只在事件循环线程中使用，不需要加锁。
+    """
+    def __init__(self):
+        self.timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        self._pending: Dict[Tuple[str, int], List[List[Any]]] = {}
+        self._paths: Dict[Tuple[str, int], Path] = {}
+
+    def write(self, province: str, year: int, row: List[Any]):
+        """
+        暂存一行结果，格式为 [province, city, year, ...]
+        """
+        self._pending.setdefault((province, year), []).append([province, *row])
+
+    def _write_rows(self, key: Tuple[str, int]):
+        """
+        把一个文件暂存的结果行一次性写入磁盘，写入失败时保留暂存的行并抛出 OSError
+        """
+        pending_rows = self._pending.get(key)
+        if not pending_rows:
+            return
+        filepath = self._paths.get(key)
+        is_new = filepath is None
+        if is_new:
+            province, year = key
+            filepath = STORAGE_DIR / f"{province}_weather_data_{year}_{self.timestamp}.csv"
+        with open(filepath, 'w' if is_new else 'a', newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE) as f:
+            writer = csv.writer(f)
+            if is_new:
+                writer.writerow(CSV_HEADER)
+            writer.writerows(pending_rows)
+        self._paths[key] = filepath
+        pending_rows.clear()
+
+    def flush(self) -> Set[Tuple[str, int]]:
+        """
+        写出所有文件暂存的结果行；写入失败的文件丢弃其暂存的行
         
-        checkpoint_manager = CheckpointManager(DATA_SOURCE)
+        返回:
+            Set[Tuple[str, int]]: 写入失败的 (省份, 年份)
+        """
+        failed = set()
+        for key, pending_rows in self._pending.items():
+            try:
+                self._write_rows(key)
+            except OSError as e:
+                logger.error("保存数据到CSV时出错: %s", e)
+                pending_rows.clear()
+                failed.add(key)
+        return failed
+
+    def close(self) -> Dict[Tuple[str, int], str]:
+        """
+        写出所有文件尚未写入的结果行
         
-        # 筛选出待处理的城市
-        pending_tasks = []
-        for city, coords in cities_in_province.items():
-            if not checkpoint_manager.is_completed(city, year, province):
-                lat, lon = coords.get("latitude"), coords.get("longitude")
-                if lat is not None and lon is not None:
-                    pending_tasks.append((province, city, year, lat, lon))
-                else:
-                    logger.warning(f"跳过 {city} 因为缺少经纬度信息。")
-                    checkpoint_manager.mark_failed(city, year, "缺少经纬度信息", province)
+        返回:
+            Dict[Tuple[str, int], str]: 按 (省份, 年份) 索引的CSV文件路径
+        """
+        self.flush()
+        self._pending.clear()
         
-        if not pending_tasks:
-            logger.info(f"{province} {year}年 的所有城市数据均已处理。")
-            continue
+        paths = {}
+        for key, filepath in self._paths.items():
+            logger.info("数据已保存到: %s", filepath)
+            paths[key] = str(filepath)
+        return paths
+
 
-        logger.info(f"总城市数: {len(cities_in_province)}, 待处理任务数: {len(pending_tasks)}")
+def _save_result(province: str, city: str, year: int, result: List[Any],
+                 csv_writer: CsvResultWriter, completed_batch: CompletedBatch):
+    """
+    暂存一个任务的结果并记录为已完成；结果行在提交断点前写出
+    """
+    csv_writer.write(province, year, result)
+    completed_batch.add(city, year, province)
+
+
+async def process_task(
+    province: str,
+    city: str,
+    year: int,
+    lat: float,
+    lon: float,
+    csv_writer: CsvResultWriter,
+    api_keys: Dict[str, str],
+    api_order: Tuple[str, ...],
+    checkpoint_manager: CheckpointManager,
+    semaphores: Dict[str, asyncio.Semaphore],
+    executor: ThreadPoolExecutor,
+    completed_batch: CompletedBatch
+):
+    """
+    处理单个城市-年份任务的协程。请求的并发由各API服务的信号量分别限制，阻塞的请求交给线程池执行，
+    结果写入CSV和断点更新都在事件循环线程中完成，因此不需要加锁。
+    任务列表已由 pending_tasks 按已完成位图筛选过，这里不再逐个检查是否已完成。
+    API尝试顺序由调用方从预先生成的排列中分配。
+    """
+    try:
+        logger.debug("开始任务: %s-%s %s年", province, city, year)
+        result = await get_weather_data_with_fallback_async(
+            province, city, year, lat, lon, api_keys, api_order, semaphores, executor
+        )
+    except AllAPIsFailedException as e:
+        checkpoint_manager.mark_failed(city, year, str(e), province)
+        logger.error("任务失败: %s", e)
+        return
+    except Exception as e:
+        checkpoint_manager.mark_failed(city, year, f"未知异常: {e}", province)
+        logger.critical("任务发生严重错误: %s-%s %s年: %s", province, city, year, e, exc_info=True)
+        return
 
-        task_queue = queue.Queue()
-        for task in pending_tasks:
-            task_queue.put(task)
+    _save_result(province, city, year, result, csv_writer, completed_batch)
+    logger.info("成功处理: %s-%s %s年", province, city, year)
 
-        results: List[List[Any]] = []
-        lock = threading.Lock()
 
-        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{province[:2]}-{year}") as executor:
-            futures = [
-                executor.submit(worker, task_queue, results, api_keys, checkpoint_manager, lock)
-                for _ in range(min(max_workers, len(pending_tasks)))
-            ]
-            for future in futures:
-                future.result() # 等待线程完成
+def collect_pending_tasks(
+    city_data: Dict[str, Any],
+    provinces: List[str],
+    years: List[int],
+    checkpoint_manager: CheckpointManager
+) -> Tuple[List[str], List[str], array, array, array]:
+    """
+    将所有省份、城市、年份中尚未完成的任务展开成一个全局任务表。
+    任务按列存放，同一下标对应同一个任务；缺少经纬度的城市直接标记为失败。
+    
+    返回:
+        Tuple: (省份列表, 城市列表, 年份数组, 纬度数组, 经度数组)
+    """
+    task_provinces: List[str] = []
+    task_cities: List[str] = []
+    task_years, lats, lons = array('i'), array('d'), array('d')
+    
+    for province in provinces:
+        if province not in city_data:
+            logger.error("在城市列表中未找到省份: %s", province)
+            continue
+        
+        cities_in_province = city_data[province]
+        for city, year in checkpoint_manager.pending_tasks(cities_in_province, years):
+            coords = cities_in_province[city]
+            lat, lon = coords.get("latitude"), coords.get("longitude")
+            if lat is not None and lon is not None:
+                task_provinces.append(province)
+                task_cities.append(city)
+                task_years.append(year)
+                lats.append(lat)
+                lons.append(lon)
+            else:
+                logger.warning("跳过 %s 因为缺少经纬度信息。", city)
+                checkpoint_manager.mark_failed(city, year, "缺少经纬度信息", province)
+    
+    return task_provinces, task_cities, task_years, lats, lons
+
+
+async def collect_tasks_async(
+    provinces: List[str],
+    cities: List[str],
+    years: array,
+    lats: array,
+    lons: array,
+    api_keys: Dict[str, str],
+    checkpoint_manager: CheckpointManager,
+    max_workers: int,
+    executor: ThreadPoolExecutor
+) -> Dict[Tuple[str, int], str]:
+    """
+    在一个事件循环中并发处理全局任务表中的所有任务，每个API服务同时进行的请求数各由一个信号量限制。
+    开始前先批量查询结果缓存，命中的任务直接写入结果，不再创建协程；
+    其余任务以随机顺序启动，把各省份的请求分散开，省份之间没有等待线程池排空的间隙。
+    
+    参数:
+        provinces: 每个任务的省份
+        cities: 每个任务的城市，与其他各列按下标一一对应
+        years: 每个任务的年份
+        lats: 每个任务的纬度
+        lons: 每个任务的经度
+        api_keys: API密钥
+        checkpoint_manager: 断点管理器
+        max_workers: 每个API服务同时进行的请求数上限
+        executor: 执行阻塞请求的线程池
+        
+    返回:
+        Dict[Tuple[str, int], str]: 按 (省份, 年份) 索引的CSV文件路径，结果在任务完成时即写入
+    """
+    csv_writer = CsvResultWriter()
+    semaphores = {api_service: asyncio.Semaphore(max_workers) for api_service in API_DISPATCHER}
+    completed_batch = CompletedBatch(checkpoint_manager, csv_writer)
+    
+    cache_keys = [get_cache_key(city, year) for city, year in zip(cities, years)]
+    cached_rows = await asyncio.get_running_loop().run_in_executor(executor, load_cached_batch, cache_keys)
+    
+    order = [i for i, cache_key in enumerate(cache_keys) if cache_key not in cached_rows]
+    random.shuffle(order)
+    # 任务已随机打乱，按位置轮流分配API服务的全排列即可分散负载，不必为每个任务单独打乱
+    api_orders = list(itertools.permutations(API_DISPATCHER))
 
-        task_queue.join()
+    try:
+        if cached_rows:
+            logger.info("缓存命中任务数: %s", len(cached_rows))
+            for i, cache_key in enumerate(cache_keys):
+                if cache_key in cached_rows:
+                    _save_result(provinces[i], cities[i], years[i], cached_rows[cache_key], csv_writer, completed_batch)
+        
+        outcomes = await asyncio.gather(
+            *(process_task(provinces[i], cities[i], years[i], lats[i], lons[i],
+                           csv_writer, api_keys, api_orders[position % len(api_orders)],
+                           checkpoint_manager, semaphores, executor, completed_batch)
+              for position, i in enumerate(order)),
+            return_exceptions=True
+        )
+    finally:
+        # 中途退出时也要写出暂存的结果行并提交尚未写入断点的已完成任务
+        completed_batch.commit()
+        csv_paths = csv_writer.close()
 
-        if results:
-            save_to_csv(results, province, year)
-        else:
-            logger.warning(f"{province} {year}年 未获取到任何新数据。")
+    for i, outcome in zip(order, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.critical("任务 %s-%s %s年 异常退出: %r", provinces[i], cities[i], years[i], outcome)
 
-        # 打印统计信息
-        stats = checkpoint_manager.get_stats(province)
-        logger.info(f"统计: 总任务 {stats.get('total_tasks', 0)}, "
-                    f"已完成 {stats.get('completed_tasks', 0)}, "
-                    f"失败 {stats.get('failed_tasks', 0)}")
+    return csv_paths
 
 
 def collect_all_data(provinces: Optional[List[str]], years: Optional[List[int]], max_workers: int):
@@ -372,15 +653,31 @@ def collect_all_data(provinces: Optional[List[str]], years: Optional[List[int]],
     years_to_process = years or TARGET_YEARS
 
     logger.info("===== 开始数据收集任务 =====")
-    logger.info(f"处理省份: {', '.join(provinces_to_process)}")
-    logger.info(f"处理年份: {', '.join(map(str, years_to_process))}")
-    logger.info(f"可用API: {', '.join(api_keys.keys())}")
-    logger.info(f"最大线程数: {max_workers}")
-
-    for province in provinces_to_process:
-        collect_data_for_province(province, years_to_process, api_keys, city_data, max_workers)
-        logger.info(f"===== 完成省份 {province} 的处理 =====\n")
-        # 省份之间可以加入短暂延时
-        time.sleep(2)
+    logger.info("处理省份: %s", ', '.join(provinces_to_process))
+    logger.info("处理年份: %s", ', '.join(map(str, years_to_process)))
+    logger.info("可用API: %s", ', '.join(api_keys.keys()))
+    logger.info("最大线程数: %s", max_workers)
+
+    # 整个采集过程共用一个断点管理器和一个线程池；每个API服务各有 max_workers 个并发名额，
+    # 线程数按所有API服务的并发上限之和设置，一个服务的请求不会占满线程池而饿死其他服务。
+    # 各API模块的连接池是模块级的，线程复用后保持连接也能在所有任务间持续使用。
+    # 断点快照除了按事件数量批量写入外，至少每 CHECKPOINT_BATCH_INTERVAL 秒写一次
+    with CheckpointManager(DATA_SOURCE, background_writes=True,
+                           flush_interval=CHECKPOINT_BATCH_INTERVAL) as checkpoint_manager, \
+            ThreadPoolExecutor(max_workers=max_workers * len(API_DISPATCHER), thread_name_prefix="collector") as executor:
+        task_columns = collect_pending_tasks(city_data, provinces_to_process, years_to_process, checkpoint_manager)
+        task_count = len(task_columns[1])
+        if not task_count:
+            logger.info("所有省份和年份的城市数据均已处理。")
+            return
+        logger.info("待处理任务数: %s", task_count)
+
+        # 结果在任务完成时即按省份-年份写入各自的CSV文件
+        asyncio.run(collect_tasks_async(*task_columns, api_keys, checkpoint_manager, max_workers, executor))
+
+        for province in provinces_to_process:
+            stats = checkpoint_manager.get_stats(province)
+            logger.info("%s 统计: 总任务 %s, 已完成 %s, 失败 %s", province,
+                        stats.get('total_tasks', 0), stats.get('completed_tasks', 0), stats.get('failed_tasks', 0))
 
     logger.info("===== 所有数据收集任务完成 =====")
@@ -10,6 +10,7 @@ project_root = Path(__file__).parent
 sys.path.append(str(project_root))
 
 from data_collection.weather_data_collection import collect_all_data
+from data_collection.checkpoint_manager import YEAR_BASE
 
 def main():
     """
@@ -49,6 +50,10 @@ def main():
     
     args = parser.parse_args()
     
+    # 断点的已完成位图只能表示 YEAR_BASE 及之后的年份
+    if args.years is not None and min(args.years) < YEAR_BASE:
+        parser.error(f"年份不能早于 {YEAR_BASE}")
+    
     # 打印启动信息
     print("===== 启动天气数据采集程序 =====")
     print(f"处理省份: {'所有省份' if args.provinces is None else ', '.join(args.provinces)}")